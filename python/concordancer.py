@@ -17,7 +17,46 @@
 # 	d - formatting of the display,
 # 		'simple' - one concordance per line (default)
 # 		'group' - group concordances by keywords	 
+# 		'collocates' - instead of concordances, show tables of words 
+# 			that occur in the contexts of each keyword, with their 
+# 			counts, pointwise mutual information, t-scores and 
+# 			log-likelihood scores
+# 	m - processing mode,
+# 		'memory' - read all input before finding concordances (default)
+# 		'stream' - print concordances in the order of the input as soon
+# 			as their context is read, keeping only the context in 
+# 			memory (always uses the 'simple' display)
+# 	i - the path of an index file: if it does not exist, it is built
+# 		from the input, and then concordances are found using the index
+# 		instead of reading the input again
+# 	a - the path of a suffix array of the indexed words: if it does not
+# 		exist or was built from other words, it is built from the input,
+# 		and then keywords matching parts of words (*ectom*) are looked up
+# 		in it instead of checking every distinct word (not used when concordances are found by
+# 		several processes)
+# 	j - the number of processes that find concordances in parallel, each
+# 		in a part of the input (1 by default; not used with an index)
+# 	f - a file or directory to read the input from instead of the standard
+# 		input (can be given many times); concordances are then marked 
+# 		with the file and line where the keyword occurs
+# 	o - the order of concordances of each keyword: a comma-separated list
+# 		of positions of words to sort by, where R1 is the first word to
+# 		the right of the keyword, L2 the second word to the left, etc.
+# 		(the order of the input by default)
 #	
+# Keywords:
+# 	A keyword matches words regardless of case. A keyword can also be
+# 		run*		a prefix: all words starting with 'run'
+# 		*ectom*		a substring: all words containing 'ectom'
+# 		/ru[ns]+/	a regular expression a word must match in full
+# 		'configur* option'
+# 				a phrase: consecutive words, each matching one of
+# 				the space-separated parts
+# 	A keyword (or a part of a phrase) starting with a backslash is taken
+# 	literally without it, so \/usr/ matches the word '/usr/' and \run* the
+# 	word 'run*' (except in the streaming mode, where keywords are always 
+# 	single words, taken literally).
+#
 # Example:
 # 	to find concordances for the word 'list' in the bash manual:
 # 		man bash | concordancer.py arguments options
@@ -44,22 +83,54 @@
 
 # Imports.
 import getopt
+import os
 import sys
 
+# NumPy is optional: collocates are counted with it if it is available.
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 # Option sigils - the characters associated with various options. 
 CONTEXT_SIZE = 'c'
 PREFIX = 'p'
 SUFFIX = 's'
 DISPLAY = 'd'
+MODE = 'm'
+INDEX = 'i'
+SUFFIXES = 'a'
+JOBS = 'j'
+SORT = 'o'
+FILES = 'f'
 
 # Option default values, represented as a map for convenience.
 OPTIONS = {\
 	CONTEXT_SIZE: str(5), \
 	PREFIX: '*', \
 	SUFFIX: '*', \
-	DISPLAY: 'simple'\
+	DISPLAY: 'simple', \
+	MODE: 'memory', \
+	INDEX: '', \
+	SUFFIXES: '', \
+	JOBS: str(1), \
+	SORT: '', \
+	FILES: []\
 }
 
+# Processing modes.
+STREAM = 'stream'
+
+# Displays.
+COLLOCATES = 'collocates'
+
+# The number of lines printed at once.
+OUTPUT_BUFFER = 4096
+
+# The number of concordances sorted in memory at once; more are sorted in
+# runs stored in temporary files, which are then merged.
+SORT_BUFFER = 1000000
+
 # Character constants, also for convenience.
 EMPTY = ""
 SPACE = " "
@@ -83,87 +154,1261 @@ Options:
     %s    formatting of the display,
         'simple' - one concordance per line (default)
         'group' - group concordances by keywords
+        'collocates' - instead of concordances, show tables of words 
+            that occur in the contexts of each keyword, with their 
+            counts, pointwise mutual information, t-scores and 
+            log-likelihood scores
+    %s    processing mode,
+        'memory' - read all input before finding concordances (default)
+        'stream' - print concordances in the order of the input as soon
+            as their context is read (always uses the 'simple' display)
+    %s    the path of an index file: if it does not exist, it is built
+        from the input, and then concordances are found using the index
+        instead of reading the input again
+    %s    the path of a suffix array of the indexed words: if it does not
+        exist or was built from other words, it is built from the input,
+        and then keywords matching parts of words (*ectom*) are looked up
+        in it instead of checking every distinct word (not used when concordances are found by
+        several processes)
+    %s    the number of processes that find concordances in parallel, each
+        in a part of the input (1 by default; not used with an index)
+    %s    a file or directory to read the input from instead of the standard
+        input (can be given many times); concordances are then marked 
+        with the file and line where the keyword occurs
+    %s    the order of concordances of each keyword: a comma-separated list
+        of positions of words to sort by, where R1 is the first word to
+        the right of the keyword, L2 the second word to the left, etc.
+        (the order of the input by default)
 Words:
 	The list of words that concordances will be searched for. If
 	no list is provided, a complete concordance is made - that is,
-	one using all input words.""" \
-	% (program_name, CONTEXT_SIZE, PREFIX, SUFFIX, DISPLAY)
+	one using all input words. Apart from single words, a keyword can 
+	be a prefix (run*), a substring (*ectom*), a regular expression 
+	(/ru[ns]+/) or a phrase of several of those separated by spaces 
+	('configur* option'). A keyword starting with a backslash is taken
+	literally without it (\\/usr/ matches the word '/usr/'). """ \
+	% (program_name, CONTEXT_SIZE, PREFIX, SUFFIX, DISPLAY, MODE, INDEX, \
+	SUFFIXES, JOBS, FILES, SORT)
 	print(help_string)
 
-def find_concordances(keywords, words, context_size):
+def find_concordances(keywords, words, context_size, index=None):
 	"""	Finds concordances for keywords in a list of input words.
 
 	@param keywords - list of keywords,
 	@param words - input text as a list of words
 	@param context_size - number of words that should surround a keyword
-	@return list of concordances"""
+	@param index - index of the input words (see build_index), built if
+		not given
+	@return map of keywords to their concordances (Concordances objects)"""
 
-	# Initialize the concordance map with empty lists, for each keyword.
-	concordances = prep_concordance_map(keywords)
+	concordances = {}
 
-	# If any word in the text matches a keyword, create a concordance.	
-	for i in range(0, len(words)):
-		for keyword in keywords:
-			if matches(keyword, words[i]):
-				concordance = form_concordance(words, i, context_size)
-				concordances[keyword].append(concordance)
+	if index is None:
+		index = build_index(words)
+
+	# Look up the positions of each keyword: the concordances are formed 
+	# from them when they are printed. A keyword given twice gets its
+	# concordances twice.
+	for keyword in keywords:
+		positions = query_positions(keyword, index)
+		if keyword in concordances:
+			concordances[keyword].positions.extend(positions)
+		else:
+			concordances[keyword] = Concordances(len(words), context_size, \
+				query_length(keyword), positions)
 	
 	return concordances
 
+def query_length(keyword):
+	"""	Count the words matched by a keyword.
+
+	@param keyword - a keyword, possibly a phrase
+	@return number of words"""
+
+	return max(len(keyword.split()), 1)
+
+def expand_pattern(pattern, index):
+	"""	Find the words in an index that match a part of a keyword: a word, a
+	prefix ending with an asterisk, a substring between asterisks, or a 
+	regular expression between slashes. A part starting with a backslash
+	is a word, without the backslash.
+
+	@param pattern - part of a keyword
+	@param index - index of the input words (see build_index), a 
+		CorpusIndex, or a SubstringIndex
+	@return list of lowercase words"""
+
+	if pattern.startswith('\\'):
+		return [pattern[1:].lower()]
+
+	if len(pattern) > 1 and pattern.startswith('/') and pattern.endswith('/'):
+		expression = compile_pattern(pattern)
+		return [term for term in index.keys() if expression.fullmatch(term)]
+
+	if len(pattern) > 2 and pattern.startswith('*') and pattern.endswith('*'):
+		substring = pattern[1:-1].lower()
+		if isinstance(index, SubstringIndex):
+			return index.containing(substring)
+		return [term for term in index.keys() if substring in term]
+
+	if pattern.endswith('*'):
+		prefix = pattern[:-1].lower()
+		if isinstance(index, SubstringIndex):
+			return index.prefixed(prefix)
+		if isinstance(index, dict):
+			return [term for term in index if term.startswith(prefix)]
+		return list(index.prefixed(prefix))
+
+	return [pattern.lower()]
+
+def compile_pattern(pattern):
+	"""	Compile the regular expression in a part of a keyword.
+
+	@param pattern - part of a keyword, a regular expression between slashes
+	@return compiled regular expression, ignoring case
+	@raise ValueError if the regular expression is invalid"""
+
+	import re
+
+	try:
+		return re.compile(pattern[1:-1], re.IGNORECASE)
+	except re.error as error:
+		raise ValueError('Invalid regular expression %s: %s' % (pattern, \
+			error))
+
+def check_keyword(keyword):
+	"""	Check that the regular expressions in a keyword are valid.
+
+	@param keyword - a keyword, possibly a phrase
+	@raise ValueError if any of them is invalid"""
+
+	for pattern in keyword.split():
+		if len(pattern) > 1 and pattern.startswith('/') and \
+				pattern.endswith('/'):
+			compile_pattern(pattern)
+
+def pattern_positions(pattern, index):
+	"""	Find the positions of all words matching a part of a keyword.
+
+	@param pattern - part of a keyword (see expand_pattern)
+	@param index - index of the input words
+	@return sorted sequence of positions"""
+
+	import heapq
+
+	postings = [index.get(term) for term in expand_pattern(pattern, index)]
+	postings = [positions for positions in postings if positions is not None]
+	if len(postings) == 1:
+		return postings[0]
+	return list(heapq.merge(*postings))
+
+def query_positions(keyword, index):
+	"""	Find the positions where a keyword occurs. For a phrase, the 
+	position of its first word is given.
+
+	@param keyword - a keyword (see expand_pattern), or several separated
+		by whitespace, which must match consecutive words
+	@param index - index of the input words
+	@return sorted sequence of positions"""
+
+	import bisect
+
+	patterns = keyword.split() or [keyword]
+	if len(patterns) == 1:
+		return pattern_positions(patterns[0], index)
+
+	# Start from the positions of the first word and keep those which are 
+	# followed by the other words of the phrase.
+	postings = [pattern_positions(pattern, index) for pattern in patterns]
+	found = []
+	for i in postings[0]:
+		for k in range(1, len(postings)):
+			positions = postings[k]
+			j = bisect.bisect_left(positions, i + k)
+			if j == len(positions) or positions[j] != i + k:
+				break
+		else:
+			found.append(i)
+
+	return found
+
+def build_index(words):
+	"""	Map the input words to the positions where they occur, in a single
+	pass. Words are lowercased, so that looking up a lowercased keyword
+	finds all of its occurrences, as with matches.
+
+	@param words - input text as a list of words
+	@return map of lowercase words to lists of positions"""
+
+	index = {}
+	for i in range(0, len(words)):
+		word = words[i].lower()
+		positions = index.get(word)
+		if positions is None:
+			index[word] = [i]
+		else:
+			positions.append(i)
+
+	return index
+
+# The index file format: a magic string followed by a header of 64-bit
+# numbers, and then the sections listed in the header, each starting at an
+# offset divisible by 8. Words are stored as IDs of their types (the distinct
+# words as they appear in the text), and each type is stored as the offsets
+# of its UTF-8 encoded text in a blob. Lowercase words (terms) are stored
+# likewise, sorted, together with the offsets of their positions in a 
+# list of postings.
+INDEX_MAGIC = b'CONCIDX1'
+INDEX_HEADER = ['words', 'types', 'terms', 'words_offset', \
+	'type_offsets_offset', 'type_blob_offset', 'term_offsets_offset', \
+	'term_blob_offset', 'posting_offsets_offset', 'postings_offset', 'size']
+
+def write_index(path, words):
+	"""	Build an index of the input words and write it to a file, so that
+	it can be opened with CorpusIndex.
+
+	@param path - path of the index file
+	@param words - input text as a list of words"""
+
+	from array import array
+
+	# Assign IDs to types and convert the text to a list of IDs.
+	type_ids = {}
+	tokens = array('I')
+	for word in words:
+		type_id = type_ids.get(word)
+		if type_id is None:
+			type_id = type_ids[word] = len(type_ids)
+		tokens.append(type_id)
+	types = sorted(type_ids, key = type_ids.get)
+
+	index = build_index(words)
+	terms = sorted(index)
+
+	def blob(strings):
+		offsets = array('Q', [0])
+		data = []
+		for string in strings:
+			encoded = string.encode('utf-8')
+			data.append(encoded)
+			offsets.append(offsets[-1] + len(encoded))
+		return offsets, EMPTY.encode().join(data)
+
+	type_offsets, type_blob = blob(types)
+	term_offsets, term_blob = blob(terms)
+
+	posting_offsets = array('Q', [0])
+	postings = array('I')
+	for term in terms:
+		postings.extend(index[term])
+		posting_offsets.append(len(postings))
+
+	sections = [tokens, type_offsets, type_blob, term_offsets, term_blob, \
+		posting_offsets, postings]
+
+	# Lay out the sections after the header.
+	header = array('Q', [0] * len(INDEX_HEADER))
+	position = len(INDEX_MAGIC) + len(header) * header.itemsize
+	offsets = []
+	for section in sections:
+		position += -position % 8
+		offsets.append(position)
+		position += len(section) * getattr(section, 'itemsize', 1)
+	header[:] = array('Q', [len(words), len(types), len(terms)] + offsets + \
+		[position])
+
+	output = open(path, 'wb')
+	try:
+		output.write(INDEX_MAGIC)
+		header.tofile(output)
+		for offset, section in zip(offsets, sections):
+			output.write(bytes(offset - output.tell()))
+			output.write(section if isinstance(section, bytes) \
+				else section.tobytes())
+	finally:
+		output.close()
+
+class CorpusIndex:
+	"""	An index file written by write_index, mapped into memory.
+
+	Nothing is read from the file up front: word IDs, positions and the
+	text of words are read from the mapped file as they are needed. The
+	index can be used in place of the map returned by build_index, and its
+	words attribute in place of the list of input words.
+
+	The positions returned by get and positions are views of the mapped
+	file rather than copies, so they must be dropped before the index is 
+	closed: close raises BufferError while any of them is still in use."""
+
+	def __init__(self, path):
+		"""	Open an index file.
+
+		@param path - path of the index file"""
+
+		import mmap
+		import struct
+
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		if self.map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+			raise ValueError('%s is not a concordance index' % path)
+
+		view = memoryview(self.map)
+		start = len(INDEX_MAGIC)
+		header = view[start : start + 8 * len(INDEX_HEADER)].cast('Q')
+		self.header = dict(zip(INDEX_HEADER, header.tolist()))
+		header.release()
+
+		def section(name, count, format):
+			offset = self.header[name + '_offset']
+			return view[offset : offset + count * struct.calcsize(format)] \
+				.cast(format)
+
+		h = self.header
+		self.tokens = section('words', h['words'], 'I')
+		self.type_offsets = section('type_offsets', h['types'] + 1, 'Q')
+		self.type_blob = view[h['type_blob_offset'] : \
+			h['term_offsets_offset']]
+		self.term_offsets = section('term_offsets', h['terms'] + 1, 'Q')
+		self.term_blob = view[h['term_blob_offset'] : \
+			h['posting_offsets_offset']]
+		self.posting_offsets = section('posting_offsets', h['terms'] + 1, 'Q')
+		postings_offset = h['postings_offset']
+		self.postings = view[postings_offset : h['size']].cast('I')
+
+		self.types = {}
+		self.words = IndexedWords(self)
+
+	def type(self, type_id):
+		"""	Get the text of a type.
+
+		@param type_id - ID of the type
+		@return string"""
+
+		text = self.types.get(type_id)
+		if text is None:
+			start = self.type_offsets[type_id]
+			end = self.type_offsets[type_id + 1]
+			text = self.types[type_id] = \
+				bytes(self.type_blob[start : end]).decode('utf-8')
+		return text
+
+	def term(self, term_id):
+		"""	Get the text of a term.
+
+		@param term_id - position of the term in the sorted list of terms
+		@return string"""
+
+		start = self.term_offsets[term_id]
+		end = self.term_offsets[term_id + 1]
+		return bytes(self.term_blob[start : end]).decode('utf-8')
+
+	def find_term(self, term):
+		"""	Find a term by binary search.
+
+		@param term - lowercase word
+		@return position of the term in the sorted list of terms, or of the
+			first term after it"""
+
+		low, high = 0, self.header['terms']
+		while low < high:
+			middle = (low + high) // 2
+			if self.term(middle) < term:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def positions(self, term_id):
+		"""	Get the positions of a term.
+
+		@param term_id - position of the term in the sorted list of terms
+		@return sequence of positions of the term in the text"""
+
+		start = self.posting_offsets[term_id]
+		end = self.posting_offsets[term_id + 1]
+		return self.postings[start : end]
+
+	def keys(self):
+		"""	List all terms, like build_index().keys().
+
+		@return generator of lowercase words in order"""
+
+		for term_id in range(0, self.header['terms']):
+			yield self.term(term_id)
+
+	def prefixed(self, prefix):
+		"""	List the terms starting with a prefix.
+
+		@param prefix - lowercase prefix
+		@return generator of lowercase words in order"""
+
+		term_id = self.find_term(prefix)
+		while term_id < self.header['terms']:
+			term = self.term(term_id)
+			if not term.startswith(prefix):
+				break
+			yield term
+			term_id += 1
+
+	def get(self, term, default = None):
+		"""	Get the positions of a term, like build_index()[term].
+
+		@param term - lowercase word
+		@param default - value returned if the term does not occur
+		@return sequence of positions of the term in the text"""
+
+		term_id = self.find_term(term)
+		if term_id < self.header['terms'] and self.term(term_id) == term:
+			return self.positions(term_id)
+		return default
+
+	def close(self):
+		"""	Release the mapped file. The positions returned by get and 
+		positions must not be in use any more."""
+
+		self.tokens.release()
+		self.type_offsets.release()
+		self.type_blob.release()
+		self.term_offsets.release()
+		self.term_blob.release()
+		self.posting_offsets.release()
+		self.postings.release()
+		self.map.close()
+		self.file.close()
+
+class IndexedWords:
+	"""	The words of an indexed text, as a read-only list."""
+
+	def __init__(self, index):
+		self.index = index
+
+	def __len__(self):
+		return len(self.index.tokens)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self.index.type(type_id) for type_id in self.index.tokens[i]]
+		return self.index.type(self.index.tokens[i])
+
+	def __iter__(self):
+		for type_id in self.index.tokens:
+			yield self.index.type(type_id)
+
+def suffix_array(text):
+	"""	Sort the suffixes of a text by prefix doubling: the suffixes are 
+	sorted by their first character, and then repeatedly by pairs of the
+	ranks of their first k and next k characters, doubling k each time 
+	until all ranks differ. Every round is a sort of integer keys, and the 
+	number of rounds is the logarithm of the longest repeated substring.
+
+	@param text - sequence of character codes
+	@return list of the starting positions of suffixes in order"""
+
+	n = len(text)
+	suffixes = sorted(range(0, n), key = text.__getitem__)
+
+	# Rank the suffixes by their first character.
+	rank = [0] * n
+	for j in range(1, n):
+		rank[suffixes[j]] = rank[suffixes[j - 1]] + \
+			(text[suffixes[j]] != text[suffixes[j - 1]])
+
+	k = 1
+	while n and rank[suffixes[-1]] < n - 1:
+		# Suffixes shorter than k come first among those of the same rank.
+		keys = [rank[i] * (n + 1) + (rank[i + k] + 1 if i + k < n else 0) \
+			for i in range(0, n)]
+		suffixes.sort(key = keys.__getitem__)
+		for j in range(1, n):
+			rank[suffixes[j]] = rank[suffixes[j - 1]] + \
+				(keys[suffixes[j]] != keys[suffixes[j - 1]])
+		k *= 2
+
+	return suffixes
+
+# The suffix array file format: a magic string followed by a header of 64-bit
+# numbers, and then three arrays of 32-bit numbers, each starting at an
+# offset divisible by 8: the text, the positions where the terms start in
+# the text, and the suffix array of the text. The text consists of the 
+# sorted terms of an index, each preceded by a zero, as character codes.
+# The CRC-32 of the text identifies the terms the file was built from.
+SUFFIX_MAGIC = b'CONCSFX2'
+SUFFIX_HEADER = ['characters', 'terms', 'checksum', 'text_offset', \
+	'starts_offset', 'suffixes_offset', 'size']
+
+def suffix_text(terms):
+	"""	Join the terms of an index into the text of a suffix array.
+
+	@param terms - iterable of lowercase words
+	@return array of character codes, and array of the positions where 
+		the terms start in it"""
+
+	from array import array
+
+	text = array('I')
+	starts = array('I')
+	for term in sorted(terms):
+		starts.append(len(text))
+		text.append(0)
+		text.frombytes(term.encode('utf-32-le'))
+	return text, starts
+
+def write_suffix_array(path, terms):
+	"""	Build a suffix array of the terms of an index and write it to a 
+	file, so that it can be opened with SubstringIndex.
+
+	@param path - path of the suffix array file
+	@param terms - iterable of lowercase words"""
+
+	from array import array
+	import zlib
+
+	text, starts = suffix_text(terms)
+	suffixes = array('I', suffix_array(text))
+
+	sections = [text, starts, suffixes]
+
+	# Lay out the sections after the header.
+	header = array('Q', [0] * len(SUFFIX_HEADER))
+	position = len(SUFFIX_MAGIC) + len(header) * header.itemsize
+	offsets = []
+	for section in sections:
+		position += -position % 8
+		offsets.append(position)
+		position += len(section) * section.itemsize
+	header[:] = array('Q', [len(text), len(starts), zlib.crc32(text)] + \
+		offsets + [position])
+
+	output = open(path, 'wb')
+	try:
+		output.write(SUFFIX_MAGIC)
+		header.tofile(output)
+		for offset, section in zip(offsets, sections):
+			output.write(bytes(offset - output.tell()))
+			output.write(section.tobytes())
+	finally:
+		output.close()
+
+def check_suffix_array(path, terms):
+	"""	Check whether a suffix array file was built from the terms of an
+	index, by their number and checksum.
+
+	@param path - path of the suffix array file
+	@param terms - iterable of lowercase words
+	@return True if it was, False if the terms differ or the file is not 
+		a suffix array"""
+
+	from array import array
+	import zlib
+
+	source = open(path, 'rb')
+	try:
+		if source.read(len(SUFFIX_MAGIC)) != SUFFIX_MAGIC:
+			return False
+		header = array('Q')
+		try:
+			header.fromfile(source, len(SUFFIX_HEADER))
+		except EOFError:
+			return False
+	finally:
+		source.close()
+	header = dict(zip(SUFFIX_HEADER, header.tolist()))
+
+	text, starts = suffix_text(terms)
+	return header['terms'] == len(starts) and \
+		header['characters'] == len(text) and \
+		header['checksum'] == zlib.crc32(text)
+
+class SubstringIndex:
+	"""	An index of the input words together with a suffix array file 
+	written by write_suffix_array, mapped into memory.
+
+	The terms containing a substring are found by binary search in the 
+	suffix array. Otherwise, the index is used in place of the one it
+	wraps."""
+
+	def __init__(self, index, path):
+		"""	Open a suffix array file.
+
+		@param index - index of the input words (see build_index), or a
+			CorpusIndex
+		@param path - path of the suffix array file"""
+
+		import mmap
+
+		self.index = index
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		if self.map[:len(SUFFIX_MAGIC)] != SUFFIX_MAGIC:
+			raise ValueError('%s is not a suffix array' % path)
+
+		view = memoryview(self.map)
+		start = len(SUFFIX_MAGIC)
+		header = view[start : start + 8 * len(SUFFIX_HEADER)].cast('Q')
+		self.header = dict(zip(SUFFIX_HEADER, header.tolist()))
+		header.release()
+
+		def section(name, count):
+			offset = self.header[name + '_offset']
+			return view[offset : offset + count * 4].cast('I')
+
+		h = self.header
+		self.text = section('text', h['characters'])
+		self.starts = section('starts', h['terms'])
+		self.suffixes = section('suffixes', h['characters'])
+
+	def term(self, term_id):
+		"""	Get the text of a term.
+
+		@param term_id - position of the term in the sorted list of terms
+		@return string"""
+
+		start = self.starts[term_id] + 1
+		if term_id + 1 < self.header['terms']:
+			end = self.starts[term_id + 1]
+		else:
+			end = self.header['characters']
+		return bytes(self.text[start : end]).decode('utf-32-le')
+
+	def find_suffix(self, codes, after):
+		"""	Find a substring among the sorted suffixes by binary search.
+
+		@param codes - list of character codes of the substring
+		@param after - False: find the first suffix starting with the 
+			substring (or following it), True: find the first suffix 
+			following all those starting with the substring
+		@return position in the suffix array"""
+
+		low, high = 0, self.header['characters']
+		while low < high:
+			middle = (low + high) // 2
+			start = self.suffixes[middle]
+			prefix = self.text[start : start + len(codes)].tolist()
+			if prefix < codes or (after and prefix == codes):
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def containing(self, substring):
+		"""	List the terms containing a substring.
+
+		@param substring - lowercase string
+		@return list of lowercase words in order"""
+
+		import bisect
+
+		codes = [ord(character) for character in substring]
+		first = self.find_suffix(codes, False)
+		last = self.find_suffix(codes, True)
+
+		# Each suffix belongs to the term starting at or before it.
+		term_ids = set()
+		for position in self.suffixes[first : last]:
+			term_ids.add(bisect.bisect_right(self.starts, position) - 1)
+		return [self.term(term_id) for term_id in sorted(term_ids)]
+
+	def prefixed(self, prefix):
+		"""	List the terms starting with a prefix.
+
+		@param prefix - lowercase prefix
+		@return list of lowercase words in order"""
+
+		return self.containing(chr(0) + prefix)
+
+	def keys(self):
+		"""	List all terms, like build_index().keys().
+
+		@return iterable of lowercase words"""
+
+		return self.index.keys()
+
+	def get(self, term, default = None):
+		"""	Get the positions of a term, like build_index()[term].
+
+		@param term - lowercase word
+		@param default - value returned if the term does not occur
+		@return sequence of positions of the term in the text"""
+
+		return self.index.get(term, default)
+
+	def close(self):
+		"""	Release the mapped file, and the index it wraps if that is a
+		CorpusIndex."""
+
+		self.text.release()
+		self.starts.release()
+		self.suffixes.release()
+		self.map.close()
+		self.file.close()
+		if isinstance(self.index, CorpusIndex):
+			self.index.close()
+
 def find_all_concordances(words, context_size):
 	"""	Make a complete concordance - assume all words match.
 
 	@param words - input text as a list of words
 	@param context_size - number of words that should surround a keyword
-	@return list of concordances"""
+	@return map of words to their concordances (Concordances objects)"""
 
 	concordances = {}
+	size = len(words)
 
-	for i in range(0, len(words)):
+	for i in range(0, size):
 		word = words[i]
-		if word not in concordances:
-			concordances[word] = []
-		concordance = form_concordance(words, i, context_size)
-		concordances[word].append(concordance)
+		hits = concordances.get(word)
+		if hits is None:
+			hits = concordances[word] = Concordances(size, context_size)
+		hits.append(i)
 
 	return concordances 
 
-def print_concordances(concordances, simple, prefix, suffix):
+def stream_concordances(keywords, words, context_size):
+	"""	Finds concordances for keywords in a stream of input words, yielding
+	each concordance as soon as the words following the keyword are read.
+	Only the last 2 * context_size + 1 words are kept in memory.
+
+	@param keywords - list of keywords, or an empty list to make a complete
+		concordance
+	@param words - input text as an iterable of words
+	@param context_size - number of words that should surround a keyword
+	@return generator of (keyword, words, concordance) triples in the order
+		of the input, where the concordance refers to the words (see
+		form_concordance)"""
+
+	from collections import deque
+
+	# Map lowercase keywords to the keywords as given.
+	lookup = {}
+	for keyword in keywords:
+		lookup.setdefault(keyword.lower(), keyword)
+
+	def concordance_at(window, centre):
+		word = window[centre]
+		keyword = lookup.get(word.lower()) if keywords else word
+		if keyword is None:
+			return None
+		words = list(window)
+		return (keyword, words, form_concordance(words, centre, context_size))
+
+	# The window ends with the word just read. Once it holds context_size
+	# words past a word, that word's concordance is complete.
+	window = deque(maxlen = 2 * context_size + 1)
+	for word in words:
+		window.append(word)
+		centre = len(window) - context_size - 1
+		if centre >= 0:
+			concordance = concordance_at(window, centre)
+			if concordance is not None:
+				yield concordance
+
+	# The last words of the input have shorter right contexts.
+	window = list(window)
+	for centre in range(max(len(window) - context_size, 0), len(window)):
+		concordance = concordance_at(window, centre)
+		if concordance is not None:
+			yield concordance
+
+# The input text shared by the processes finding concordances in shards.
+shard_text = EMPTY
+
+def init_shard(text):
+	"""	Prepare a worker process for finding concordances in shards.
+
+	@param text - the whole input text"""
+
+	global shard_text
+	shard_text = text
+
+def split_shards(text, count):
+	"""	Split a text into parts of roughly the same size, at whitespace.
+
+	@param text - the input text
+	@param count - the number of parts
+	@return list of (start, end) character ranges"""
+
+	import re
+	whitespace = re.compile(r'\s')
+
+	boundaries = [0]
+	for i in range(1, count):
+		position = max(len(text) * i // count, boundaries[-1])
+		match = whitespace.search(text, position)
+		boundaries.append(match.start() if match else len(text))
+	boundaries.append(len(text))
+
+	return [(boundaries[i], boundaries[i + 1]) for i in range(0, count) \
+		if boundaries[i] < boundaries[i + 1]]
+
+def words_around(text, start, end, count):
+	"""	Read the words that precede and follow a range of a text.
+
+	@param text - the input text
+	@param start - beginning of the range
+	@param end - end of the range
+	@param count - the number of words to read on each side
+	@return list of words preceding the range, and list of words following
+		it, each up to count words long"""
+
+	if count == 0:
+		return [], []
+
+	# Look at increasingly large pieces of text until they contain one word
+	# more than needed, since the outermost word may be cut in half.
+	size = 64
+	while True:
+		low = max(start - size, 0)
+		before = text[low : start].split()
+		if low == 0 or len(before) > count:
+			before = before[-count:]
+			break
+		size *= 2
+
+	size = 64
+	while True:
+		high = min(end + size, len(text))
+		after = text[end : high].split()
+		if high == len(text) or len(after) > count:
+			after = after[:count]
+			break
+		size *= 2
+
+	return before, after
+
+def find_shard_concordances(task):
+	"""	Find concordances in a part of the input text. The words of the part
+	are extended by context_size words on either side, so concordances near
+	the edges of the part get their full contexts, but keywords are only
+	looked for within the part.
+
+	@param task - tuple of the range of the part, the list of keywords (or
+		an empty list to make a complete concordance), and the context size
+	@return number of words in the part, and a map of keywords to arrays of
+		positions where they occur, relative to the first word of the part"""
+
+	from array import array
+
+	(start, end), keywords, context_size = task
+	text = shard_text
+
+	# Phrases starting near the end of the part need words beyond the 
+	# context.
+	overlap = context_size + max([query_length(keyword) \
+		for keyword in keywords] + [1]) - 1
+
+	words = text[start : end].split()
+	before, after = words_around(text, start, end, overlap)
+	extended = before + words + after
+	offset = len(before)
+
+	if keywords == []:
+		concordances = find_all_concordances(words, context_size)
+		return len(words), dict([(keyword, concordances[keyword].positions) \
+			for keyword in concordances])
+
+	# Positions in the extended list of words, shifted so that the first word
+	# of the part is at position 0. Keywords in the overlap are skipped.
+	concordances = find_concordances(keywords, extended, context_size)
+	shifted = {}
+	for keyword in concordances:
+		shifted[keyword] = array('I', [i - offset \
+			for i in concordances[keyword].positions \
+			if offset <= i < offset + len(words)])
+	return len(words), shifted
+
+def find_sharded_concordances(keywords, text, context_size, jobs):
+	"""	Find concordances using several processes, each working on a part
+	of the input text.
+
+	@param keywords - list of keywords, or an empty list to make a complete
+		concordance
+	@param text - the input text
+	@param context_size - number of words that should surround a keyword
+	@param jobs - the number of processes
+	@return map of keywords to their concordances (Concordances objects),
+		and the list of all input words, which the concordances refer to"""
+
+	from array import array
+	import multiprocessing
+
+	# Keywords given several times are looked for once.
+	unique = []
+	for keyword in keywords:
+		if keyword not in unique:
+			unique.append(keyword)
+
+	shards = split_shards(text, jobs)
+	tasks = [(shard, unique, context_size) for shard in shards]
+
+	# The processes only send back the positions of keywords, and the words
+	# are split here while they work.
+	pool = multiprocessing.Pool(jobs, init_shard, (text,))
+	try:
+		pending = pool.map_async(find_shard_concordances, tasks, 1)
+		words = text.split()
+		results = pending.get()
+	finally:
+		pool.close()
+		pool.join()
+
+	# Merge the parts in the order of the text, shifting positions by the 
+	# number of words in the preceding parts.
+	positions = dict([(keyword, array('I')) for keyword in unique])
+	base = 0
+	for count, shard_positions in results:
+		for keyword in shard_positions:
+			merged = positions.get(keyword)
+			if merged is None:
+				merged = positions[keyword] = array('I')
+			if base == 0:
+				merged.extend(shard_positions[keyword])
+			else:
+				merged.extend([base + i for i in shard_positions[keyword]])
+		base += count
+
+	concordances = {}
+	for keyword in positions:
+		length = query_length(keyword) if keywords else 1
+		concordances[keyword] = Concordances(len(words), context_size, length, \
+			positions[keyword] * keywords.count(keyword) if keywords \
+			else positions[keyword])
+	return concordances, words
+
+def parse_sort_order(order):
+	"""	Read a sort order specification, such as R1,R2,L1.
+
+	@param order - comma-separated list of positions relative to the keyword
+	@return list of (side, distance) pairs, where side is 'L' or 'R'"""
+
+	positions = []
+	for position in order.upper().split(','):
+		side, distance = position[:1], position[1:]
+		if side not in ('L', 'R') or not distance.isdigit() \
+				or int(distance) < 1:
+			raise ValueError('Invalid sort position: %s' % position)
+		positions.append((side, int(distance)))
+	return positions
+
+def sort_concordances(concordances, words, order):
+	"""	Sort the concordances of each keyword by the words around it.
+
+	Words are compared by their ranks among the lowercased words at the
+	sorting positions, so the sort keys are tuples of integers. Ties keep
+	the order of the input, and missing words (beyond the edges of the 
+	text) come first. If there are more than SORT_BUFFER concordances for
+	a keyword, they are sorted using an external merge sort.
+
+	@param concordances - map of keywords to their concordances 
+		(Concordances objects)
+	@param words - list of all input words
+	@param order - sort order (see parse_sort_order)
+	@return map of keywords to sorted concordances (Concordances objects)"""
+
+	positions = parse_sort_order(order)
+	size = len(words)
+
+	def key_positions(occurance, length):
+		return [occurance + length + distance - 1 if side == 'R' \
+			else occurance - distance for side, distance in positions]
+
+	# Assign ranks to all the words which sort keys consist of.
+	vocabulary = set()
+	for keyword in concordances:
+		hits = concordances[keyword]
+		for occurance in hits.positions:
+			for i in key_positions(occurance, hits.length):
+				if 0 <= i < size:
+					vocabulary.add(words[i].lower())
+	ranks = {}
+	for word in sorted(vocabulary):
+		ranks[word] = len(ranks)
+
+	ordered = {}
+	for keyword in concordances:
+		hits = concordances[keyword]
+
+		def sort_key(occurance):
+			return tuple([ranks[words[i].lower()] if 0 <= i < size else -1 \
+				for i in key_positions(occurance, hits.length)])
+
+		if len(hits) <= SORT_BUFFER:
+			hit_order = sorted(hits.positions, key = sort_key)
+		else:
+			hit_order = external_sort(hits.positions, sort_key)
+		ordered[keyword] = Concordances(hits.size, hits.context_size, \
+			hits.length, hit_order)
+	return ordered
+
+def external_sort(positions, sort_key):
+	"""	Sort the positions of keywords in runs of SORT_BUFFER, store the runs
+	in temporary files as arrays of integers, and merge them.
+
+	@param positions - sequence of positions of keywords
+	@param sort_key - function making a tuple of integers of a position
+	@return generator of sorted positions"""
+
+	from array import array
+	import heapq
+	import tempfile
+
+	runs = []
+
+	def write_run(records):
+		records.sort()
+		run = tempfile.TemporaryFile()
+		flat = array('q')
+		for record in records:
+			flat.extend(record)
+		flat.tofile(run)
+		run.seek(0)
+		runs.append(run)
+
+	# Records consist of the sort key, a sequence number which keeps the sort
+	# stable, and the position.
+	records = []
+	width = 0
+	for number, occurance in enumerate(positions):
+		record = sort_key(occurance) + (number, occurance)
+		width = len(record)
+		records.append(record)
+		if len(records) >= SORT_BUFFER:
+			write_run(records)
+			records = []
+	if records:
+		write_run(records)
+
+	def read_run(run):
+		block = 65536
+		while True:
+			flat = array('q')
+			try:
+				flat.fromfile(run, block * width)
+			except EOFError:
+				pass
+			for i in range(0, len(flat), width):
+				yield tuple(flat[i : i + width])
+			if len(flat) < block * width:
+				break
+		run.close()
+
+	for record in heapq.merge(*[read_run(run) for run in runs]):
+		yield record[-1]
+
+def term_ids(words, index):
+	"""	Convert the input words into IDs of their lowercase forms (terms).
+
+	@param words - list of all input words
+	@param index - index of the input words
+	@return array of term IDs of the words, list of terms by ID, and list
+		of frequencies of terms by ID"""
+
+	from array import array
+
+	ids = array('I', [0]) * len(words)
+	terms = sorted(index.keys())
+	frequencies = []
+	for term_id in range(0, len(terms)):
+		positions = index.get(terms[term_id])
+		frequencies.append(len(positions))
+		for i in positions:
+			ids[i] = term_id
+
+	return ids, terms, frequencies
+
+def find_collocates(keywords, words, context_size, index = None):
+	"""	Count the words occurring within the context of each keyword, and
+	score how strongly they are associated with it.
+
+	Co-occurrences are counted directly from the positions of the keywords,
+	without forming concordances. Words are counted by the IDs of their
+	lowercase forms (using NumPy, if it is available).
+
+	@param keywords - list of keywords, or an empty list to use every word
+	@param words - input text as a list of words
+	@param context_size - number of words on each side of a keyword
+	@param index - index of the input words (see build_index), built if
+		not given
+	@return map of keywords to lists of (word, count, PMI, t-score, 
+		log-likelihood) tuples, sorted by descending log-likelihood"""
+
+	import math
+
+	if index is None:
+		index = build_index(words)
+
+	ids, terms, frequencies = term_ids(words, index)
+	total = len(words)
+	if numpy is not None:
+		id_array = numpy.frombuffer(ids, dtype = numpy.uint32)
+
+	if keywords == []:
+		keywords = terms
+
+	collocates = {}
+	for keyword in keywords:
+		length = query_length(keyword)
+		hits = query_positions(keyword, index)
+
+		# Count the words in the windows around the hits, and the total size
+		# of the windows. Windows of nearby hits overlap, and the words they 
+		# share are counted once, so that the windows are a part of the text.
+		if numpy is not None:
+			hits = numpy.asarray(hits, dtype = numpy.int64)
+			parts = []
+			for offset in list(range(-context_size, 0)) + \
+					list(range(length, length + context_size)):
+				positions = hits + offset
+				parts.append(positions[(positions >= 0) & (positions < total)])
+			positions = numpy.unique(numpy.concatenate(parts)) if parts \
+				else numpy.zeros(0, dtype = numpy.int64)
+			present, observed = numpy.unique(id_array[positions], \
+				return_counts = True)
+			counts = zip(present.tolist(), observed.tolist())
+			window = len(positions)
+		else:
+			positions = set()
+			for hit in hits:
+				positions.update(range(max(hit - context_size, 0), hit))
+				positions.update(range(hit + length, \
+					min(hit + length + context_size, total)))
+			observed = {}
+			for i in positions:
+				observed[ids[i]] = observed.get(ids[i], 0) + 1
+			counts = observed.items()
+			window = len(positions)
+
+		# Only the words present in the windows are scored, so each table 
+		# costs as much as the windows, not as the whole vocabulary.
+		table = []
+		for term_id, observed in counts:
+			frequency = frequencies[term_id]
+			expected = float(frequency) * window / total
+			if expected <= 0:
+				continue
+			pmi = math.log(observed / expected, 2)
+			t_score = (observed - expected) / math.sqrt(observed)
+			log_likelihood = contingency_log_likelihood(observed, window, \
+				frequency, total)
+			table.append((terms[term_id], observed, pmi, t_score, \
+				log_likelihood))
+
+		table.sort(key = lambda row: (-row[4], row[0]))
+		collocates[keyword] = table
+
+	return collocates
+
+def contingency_log_likelihood(observed, window, frequency, total):
+	"""	Compute the log-likelihood ratio (G2) of a word occurring within
+	the context windows of a keyword.
+
+	@param observed - number of occurrences of the word within the windows
+	@param window - number of positions within the windows (each counted
+		once, even if the windows overlap)
+	@param frequency - number of occurrences of the word in the text
+	@param total - number of words in the text
+	@return log-likelihood score"""
+
+	import math
+
+	cells = [ \
+		(observed, window, frequency), \
+		(window - observed, window, total - frequency), \
+		(frequency - observed, total - window, frequency), \
+		(total - window - frequency + observed, total - window, \
+			total - frequency)]
+
+	score = 0.0
+	for count, row, column in cells:
+		expected = float(row) * column / total
+		if count > 0 and expected > 0:
+			score += count * math.log(count / expected)
+	return 2 * score
+
+def print_collocates(collocates, prefix, suffix):
+	"""	Print the collocate tables to screen, a header line per keyword and
+	a line of tab-separated values per word.
+
+	@param collocates - map of keywords to tables (see find_collocates)
+	@param prefix - prefix to keywords
+	@param suffix - suffix to keywords"""
+
+	buffer = []
+	for keyword in collocates:
+		buffer.append(prefix + keyword + suffix + COLON + NEWLINE)
+		for word, count, pmi, t_score, log_likelihood in collocates[keyword]:
+			buffer.append('%s%s%s%d%s%.3f%s%.3f%s%.3f%s' % (TAB, word, TAB, \
+				count, TAB, pmi, TAB, t_score, TAB, log_likelihood, NEWLINE))
+			if len(buffer) >= OUTPUT_BUFFER:
+				sys.stdout.write(EMPTY.join(buffer))
+				buffer = []
+
+	sys.stdout.write(EMPTY.join(buffer))
+
+def print_concordances(concordances, words, simple, prefix, suffix, \
+		sources = None):
 	"""	Print the concordances to screen.
 
-	@param concordances - list of concordances to display
+	Lines are collected and written out in large batches, rather than
+	written word by word.
+
+	@param concordances - map of keywords to their concordances (sequences
+		of concordances, such as Concordances objects)
+	@param words - list of all input words, which concordances refer to
 	@param simple - True: display only concordances, False: group by keywords
 	@param prefix - prefix to keywords
-	@param suffix - suffix to keywords"""
+	@param suffix - suffix to keywords
+	@param sources - sources of the input words (a CorpusSources object), 
+		if each concordance should start with the file and line of its 
+		keyword"""
 
-	# For each concordance, mark the keywords in the sentence and print it out.
+	indent = EMPTY if simple else TAB
+	buffer = []
+
+	# For each concordance, mark the keyword in the sentence and print it out.
 	for keyword in concordances:
 		if not simple:
-			sys.stdout.write(prefix + keyword + suffix + COLON + NEWLINE)
-		for words in concordances[keyword]:		
-			if not simple:
-				sys.stdout.write(TAB)
-			for i in range(0, len(words)):
-				if matches(keyword, words[i]): 
-					sys.stdout.write(prefix + words[i] + suffix)
-				else:
-					sys.stdout.write(words[i])
-				if i < len(words) - 1:
-					sys.stdout.write(SPACE)
-				else:
-					sys.stdout.write(NEWLINE)
-
-def prep_concordance_map(dict_words):
-	"""	Prepare a map with keywords as keys and empty lists as values.
-
-	@param dict_words - list of keywords"""
-
-	# Put an empty list value for each keyword as key.
-	concordances = {}
-	for word in dict_words:
-		concordances[word] = []
+			buffer.append(prefix + keyword + suffix + COLON + NEWLINE)
+		for concordance in concordances[keyword]:		
+			if sources is not None:
+				buffer.append(indent + sources.cite(concordance[2]) + COLON + \
+					SPACE)
+			else:
+				buffer.append(indent)
+			buffer.append( \
+				render_concordance(words, concordance, prefix, suffix) + NEWLINE)
+			if len(buffer) >= OUTPUT_BUFFER:
+				sys.stdout.write(EMPTY.join(buffer))
+				buffer = []
 
-	return concordances
+	sys.stdout.write(EMPTY.join(buffer))
+
+def print_concordance(words, concordance, prefix, suffix):
+	"""	Print a single concordance on a line.
+
+	@param words - list of all input words
+	@param concordance - the concordance (see form_concordance)
+	@param prefix - prefix to keywords
+	@param suffix - suffix to keywords"""
+
+	sys.stdout.write(render_concordance(words, concordance, prefix, suffix) \
+		+ NEWLINE)
+
+def render_concordance(words, concordance, prefix, suffix):
+	"""	Turn a concordance into a line of text, marking the keyword.
+
+	@param words - list of all input words
+	@param concordance - the concordance (see form_concordance)
+	@param prefix - prefix to keywords
+	@param suffix - suffix to keywords
+	@return string without a trailing new line"""
+
+	start, end, occurance, occurance_end = concordance
+	line = words[start : end]
+	keyword = SPACE.join(line[occurance - start : occurance_end - start])
+	line[occurance - start : occurance_end - start] = \
+		[prefix + keyword + suffix]
+	return SPACE.join(line)
 
 def matches(word_a, word_b):
 	"""	Case insensitive string equivalence.
@@ -174,19 +1419,79 @@ def matches(word_a, word_b):
 
 	return word_a.lower() == word_b.lower()
 
-def form_concordance(words, occurance, context_size):
+def form_concordance(words, occurance, context_size, length = 1):
 	"""	Creates a concordance.
 
 	@param words - list of all input words
 	@param occurance - index of keyword in input list
 	@param context_size - number of preceding and following words
-	@return a sublist of the input words"""
+	@param length - number of words matched by the keyword
+	@return a tuple of the position of the first word of the concordance,
+		the position following its last word, the position of the keyword,
+		and the position following the keyword, all in the list of input
+		words"""
 
 	start = occurance - context_size
 	if start < 0:
 		start = 0
 
-	return words[start : occurance + context_size + 1]
+	occurance_end = occurance + length
+	end = occurance_end + context_size
+	if end > len(words):
+		end = len(words)
+
+	return (start, end, occurance, occurance_end)
+
+class Concordances:
+	"""	The concordances of a keyword, kept as an array of the positions 
+	where it occurs in the input words. Each concordance (see 
+	form_concordance) is formed from its position when it is read, so only 
+	four bytes are stored for each one."""
+
+	__slots__ = ['size', 'context_size', 'length', 'positions']
+
+	def __init__(self, size, context_size, length = 1, positions = ()):
+		"""	Create the concordances of a keyword.
+
+		@param size - number of input words
+		@param context_size - number of preceding and following words
+		@param length - number of words matched by the keyword
+		@param positions - sequence of positions of the keyword"""
+
+		from array import array
+
+		self.size = size
+		self.context_size = context_size
+		self.length = length
+		self.positions = array('I', positions)
+
+	def append(self, occurance):
+		"""	Add an occurrence of the keyword.
+
+		@param occurance - index of keyword in input list"""
+
+		self.positions.append(occurance)
+
+	def concordance(self, occurance):
+		"""	Form the concordance of an occurrence of the keyword.
+
+		@param occurance - index of keyword in input list
+		@return concordance (see form_concordance)"""
+
+		occurance_end = occurance + self.length
+		return (max(occurance - self.context_size, 0), \
+			min(occurance_end + self.context_size, self.size), occurance, \
+			occurance_end)
+
+	def __len__(self):
+		return len(self.positions)
+
+	def __getitem__(self, i):
+		return self.concordance(self.positions[i])
+
+	def __iter__(self):
+		for occurance in self.positions:
+			yield self.concordance(occurance)
 
 def read_stdin():
 	"""	Read everything from standard input as a list.
@@ -200,6 +1505,193 @@ def read_stdin():
 
 	return words
 
+def read_stdin_text():
+	"""	Read everything from standard input as a single string.
+	
+	@return string"""
+
+	return sys.stdin.read()
+
+def stream_stdin():
+	"""	Read standard input word by word.
+
+	@return generator of strings"""
+
+	for line in sys.stdin:
+		for word in line.split():
+			yield word
+
+def list_files(paths):
+	"""	List the files at the given paths, including all the files in the
+	directories among them, recursively.
+
+	@param paths - list of paths of files and directories
+	@return list of paths of files"""
+
+	files = []
+	for path in paths:
+		if not os.path.isdir(path):
+			files.append(path)
+			continue
+		for directory, subdirectories, names in os.walk(path):
+			subdirectories.sort()
+			for name in sorted(names):
+				files.append(os.path.join(directory, name))
+	return files
+
+def scan_file(path):
+	"""	Read the words of a file, mapping it into memory rather than 
+	reading it in. The words are split at the same whitespace as by 
+	str.split(), including Unicode spaces (such as U+00A0), in UTF-8.
+
+	@param path - path of the file
+	@return generator of (word, byte offset) pairs"""
+
+	import mmap
+	import re
+
+	# Words are found between ASCII whitespace first, and the few that are
+	# not ASCII are split again at the other spaces. There are no 
+	# whitespace characters after U+3000.
+	spaces = [chr(code).encode('utf-8') for code in range(0, 0x3001) \
+		if chr(code).isspace()]
+	word_pattern = re.compile(b'[^' + b''.join(re.escape(space) \
+		for space in spaces if len(space) == 1) + b']+')
+	separator = re.compile(b'|'.join(re.escape(space) \
+		for space in spaces if len(space) > 1))
+
+	source = open(path, 'rb')
+	try:
+		if os.fstat(source.fileno()).st_size == 0:
+			return
+		data = mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ)
+		try:
+			for match in word_pattern.finditer(data):
+				word = match.group()
+				if word.isascii():
+					yield word.decode('ascii'), match.start()
+					continue
+				position = 0
+				for space in separator.finditer(word):
+					if space.start() > position:
+						yield word[position:space.start()].decode('utf-8', \
+							'replace'), match.start() + position
+					position = space.end()
+				if position < len(word):
+					yield word[position:].decode('utf-8', 'replace'), \
+						match.start() + position
+		finally:
+			data.close()
+	finally:
+		source.close()
+
+def read_files(paths):
+	"""	Read the words of many files and directories into a list, noting
+	where each of the words came from.
+
+	@param paths - list of paths of files and directories
+	@return list of strings, and the sources of the words (a CorpusSources
+		object)"""
+
+	words = []
+	sources = CorpusSources()
+	for path in list_files(paths):
+		file_id = sources.add_file(path)
+		for word, offset in scan_file(path):
+			words.append(word)
+			sources.add(file_id, offset)
+
+	return words, sources
+
+def stream_files(paths):
+	"""	Read many files and directories word by word.
+
+	@param paths - list of paths of files and directories
+	@return generator of strings"""
+
+	for path in list_files(paths):
+		for word, offset in scan_file(path):
+			yield word
+
+class CorpusSources:
+	"""	The files and byte offsets of input words, by their positions."""
+
+	def __init__(self):
+		from array import array
+
+		self.paths = []
+		self.file_ids = array('I')
+		self.offsets = array('Q')
+		self.lines = {}
+
+	def add_file(self, path):
+		"""	Register an input file.
+
+		@param path - path of the file
+		@return ID of the file"""
+
+		self.paths.append(path)
+		return len(self.paths) - 1
+
+	def add(self, file_id, offset):
+		"""	Note the source of the next input word.
+
+		@param file_id - ID of the file the word comes from
+		@param offset - byte offset of the word in the file"""
+
+		self.file_ids.append(file_id)
+		self.offsets.append(offset)
+
+	def line(self, file_id, offset):
+		"""	Find the number of the line containing a byte of a file. The
+		positions of the line ends of a file are found when it is first 
+		needed.
+
+		@param file_id - ID of the file
+		@param offset - byte offset in the file
+		@return line number, starting from 1"""
+
+		import bisect
+
+		newlines = self.lines.get(file_id)
+		if newlines is None:
+			newlines = self.lines[file_id] = self.find_newlines(file_id)
+		return bisect.bisect_left(newlines, offset) + 1
+
+	def find_newlines(self, file_id):
+		"""	List the byte offsets of the line ends of a file.
+
+		@param file_id - ID of the file
+		@return array of offsets"""
+
+		from array import array
+		import mmap
+
+		newlines = array('Q')
+		source = open(self.paths[file_id], 'rb')
+		try:
+			data = mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ)
+			try:
+				position = data.find(NEWLINE.encode())
+				while position >= 0:
+					newlines.append(position)
+					position = data.find(NEWLINE.encode(), position + 1)
+			finally:
+				data.close()
+		finally:
+			source.close()
+		return newlines
+
+	def cite(self, position):
+		"""	Describe where an input word came from.
+
+		@param position - position of the word in the input
+		@return string of the form file:line"""
+
+		file_id = self.file_ids[position]
+		return '%s%s%d' % (self.paths[file_id], COLON, \
+			self.line(file_id, self.offsets[position]))
+
 def read_option(key, options, default):
 	"""	Get an option from a map, or use a default.
 	
@@ -214,13 +1706,23 @@ def read_option(key, options, default):
 
 	return default
 
+def read_options(key, options):
+	"""	Get all the values of an option that can be given many times.
+	
+	@param key - option key
+	@param options - option map
+	@return list of values"""
+
+	return [value for option, value in options if option == SWITCH + key]
+
 def get_configuration(arguments):
 	"""	Retrieve the entire configuration of the script.
 	
 	@param arguments - script runtime parameters
 	@return map of options with defaults included
 	@return list of arguments (keywords)
-	@return list of words from standard input"""
+	@return list of words from standard input (or a generator of words, 
+		in the streaming mode)"""
 
 	# All possible option sigils are concatenated into an option string.
 	option_string = EMPTY.join([("%s" + COLON) % i for i in OPTIONS.keys()])
@@ -231,9 +1733,25 @@ def get_configuration(arguments):
 	fixed_options = {}
 	for key in OPTIONS.keys():
 		fixed_options[key] = read_option(key, options, OPTIONS[key])
+	fixed_options[FILES] = read_options(FILES, options)
 
-	# Read the list of words at standard input.
-	input = read_stdin()
+	# Read the list of words at standard input, or prepare to read it word
+	# by word. If an index is available, the input is not needed. Input 
+	# files are read when processing.
+	if fixed_options[INDEX] and os.path.exists(fixed_options[INDEX]):
+		input = None
+	elif fixed_options[FILES] and fixed_options[MODE] == STREAM:
+		input = stream_files(fixed_options[FILES])
+	elif fixed_options[FILES]:
+		input = None
+	elif fixed_options[MODE] == STREAM:
+		input = stream_stdin()
+	elif int(fixed_options[JOBS]) > 1:
+		input = read_stdin_text()
+		if input == EMPTY or input.isspace():
+			input = []
+	else:
+		input = read_stdin()
 
 	return (fixed_options, arguments, input)
 
@@ -242,24 +1760,98 @@ def process(options, arguments, input):
 	 
 	@param options - map of options with defaults included
 	@param arguments - list of arguments (keywords)
-	@param input - list of words from standard input"""
+	@param input - list of words from standard input (None if there is
+		an index or input files, the text itself if there are several jobs)"""
 
 	# Extract some key option values.
 	context_size = int(options[CONTEXT_SIZE])
 	simple = options[DISPLAY] == OPTIONS[DISPLAY]
 
-	# Conduct main processing - find the concordances.
-	concordances = {}
-	if arguments == []:
-		# If no arguments are specified, construct a concordance for all 
-		# possible keywords.
-		concordances = find_all_concordances(input, context_size)
+	# In the streaming mode, print concordances as they are found.
+	if options[MODE] == STREAM:
+		for keyword, words, concordance in \
+				stream_concordances(arguments, input, context_size):
+			print_concordance(words, concordance, options[PREFIX], \
+				options[SUFFIX])
+		return
+
+	collocates = options[DISPLAY] == COLLOCATES
+
+	# Read the input files, unless there is an index already.
+	sources = None
+	if input is None and options[FILES] and not (options[INDEX] and \
+			os.path.exists(options[INDEX])):
+		input, sources = read_files(options[FILES])
+
+	# Split the work between several processes if asked to. The processes
+	# do not use the suffix array. With an index, concordances are found 
+	# using the index in one process, so that the index is built if needed.
+	if int(options[JOBS]) > 1 and options[INDEX]:
+		sys.stderr.write('Warning: %s%s is ignored when an index is used%s' \
+			% (SWITCH, JOBS, NEWLINE))
+	elif int(options[JOBS]) > 1 and sources is not None and not collocates:
+		sys.stderr.write('Warning: %s%s is ignored when %s%s is used%s' \
+			% (SWITCH, JOBS, SWITCH, FILES, NEWLINE))
+	index = None
+	if isinstance(input, str) and not collocates and not options[INDEX]:
+		if options[SUFFIXES]:
+			sys.stderr.write('Warning: %s%s is ignored when %s%s is used%s' \
+				% (SWITCH, SUFFIXES, SWITCH, JOBS, NEWLINE))
+		concordances, input = find_sharded_concordances(arguments, input, \
+			context_size, int(options[JOBS]))
 	else:
-		# And if there are,make a concordance for only those words.
-		concordances = find_concordances(arguments, input, context_size)
+		if isinstance(input, str):
+			input = input.split()
+
+		# Use the index file if there is one, building it first if needed.
+		if options[INDEX]:
+			if not os.path.exists(options[INDEX]):
+				write_index(options[INDEX], input)
+			index = CorpusIndex(options[INDEX])
+			input = index.words
+
+		# Use the suffix array if there is one, building it first if needed.
+		if options[SUFFIXES]:
+			if index is None:
+				index = build_index(input)
+			if not os.path.exists(options[SUFFIXES]):
+				write_suffix_array(options[SUFFIXES], index.keys())
+			elif not check_suffix_array(options[SUFFIXES], index.keys()):
+				sys.stderr.write('Warning: %s was built from other words, and '\
+					'is built again%s' % (options[SUFFIXES], NEWLINE))
+				write_suffix_array(options[SUFFIXES], index.keys())
+			index = SubstringIndex(index, options[SUFFIXES])
+
+		# Collocates are displayed instead of concordances.
+		if collocates:
+			print_collocates(find_collocates(arguments, input, context_size, \
+				index), options[PREFIX], options[SUFFIX])
+			if isinstance(index, (CorpusIndex, SubstringIndex)):
+				index.close()
+			return
+
+		# Conduct main processing - find the concordances.
+		concordances = {}
+		if arguments == []:
+			# If no arguments are specified, construct a concordance for all 
+			# possible keywords.
+			concordances = find_all_concordances(input, context_size)
+		else:
+			# And if there are,make a concordance for only those words.
+			concordances = find_concordances(arguments, input, context_size, \
+				index)
+
+	# Put the concordances in order, if requested.
+	if options[SORT]:
+		concordances = sort_concordances(concordances, input, options[SORT])
 
 	# Display the results.
-	print_concordances(concordances, simple, options[PREFIX], options[SUFFIX])
+	print_concordances(concordances, input, simple, options[PREFIX], \
+		options[SUFFIX], sources)
+
+	# Release the mapped index files.
+	if isinstance(index, (CorpusIndex, SubstringIndex)):
+		index.close()
 
 # The processing starts here.
 if __name__ == '__main__':
@@ -271,6 +1863,14 @@ if __name__ == '__main__':
 		display_help(sys.argv[0])
 		exit(1)
 
+	# Invalid keywords are reported before any work is done.
+	try:
+		for keyword in arguments:
+			check_keyword(keyword)
+	except ValueError as error:
+		sys.stderr.write(str(error) + NEWLINE)
+		exit(1)
+
 	# If evverything is in order, start concordancing.
 	process(options, arguments, input)
 
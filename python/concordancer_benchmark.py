@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+#
+# Concordancer benchmark
+#
+# Measures the speed and memory use of finding and printing concordances
+# with concordancer.py.
+#
+# The input is a synthetic corpus of pseudo-words whose frequencies follow
+# Zipf's law: the word of rank r occurs with probability proportional to
+# 1 / r^s. Keywords are picked evenly across the ranks, so every keyword set
+# mixes frequent and rare words. For every combination of keyword count and
+# context size, find_concordances, find_all_concordances and the printing of
+# concordances are timed, and their speed is given in input tokens per
+# second. Every case runs in a separate process, which builds the corpus
+# first; how much the peak resident set size of the process grows after
+# that is recorded as the memory used by the function.
+#
+# Before the timing, find_collocates is checked against a plain count of
+# the words around each keyword, on a text where the windows of nearby
+# keywords overlap and on many small random texts. Disagreements are
+# reported as failures.
+#
+# The results can be saved as a JSON baseline, and later runs can be compared
+# against it to spot performance regressions.
+#
+# Usage:
+#     concordancer_benchmark.py [OPTIONS]
+#
+# Options:
+#   -w WORDS, --words=WORDS
+#                         Number of words in the corpus (default: 100000).
+#   -v VOCABULARY, --vocabulary=VOCABULARY
+#                         Number of distinct words in the corpus (default:
+#                         10000).
+#   -z EXPONENT, --exponent=EXPONENT
+#                         Exponent of the Zipf distribution (default: 1.0).
+#   -k COUNTS, --keywords=COUNTS
+#                         Comma-separated keyword counts (default: 1,10,100).
+#   -c SIZES, --contexts=SIZES
+#                         Comma-separated context sizes (default: 2,5,10).
+#   -o FILE, --output=FILE
+#                         Save the results as a JSON baseline.
+#   -b FILE, --baseline=FILE
+#                         Compare the results with a JSON baseline.
+#   -t TOLERANCE, --tolerance=TOLERANCE
+#                         Report cases slower than the baseline by more than
+#                         this fraction (default: 0.2).
+#
+# Requires:
+#     Python 3, a Unix system (for measuring memory use)
+#
+# Author:
+#     Konrad Siek <konrad.siek@gmail.com>
+#
+# License information:
+#     Copyright 2009 Konrad Siek
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import concordancer
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+EMPTY = ''
+
+# The minimum time spent timing each case (seconds).
+MIN_TIME = 0.2
+
+# The number of small random texts find_collocates is checked on.
+COLLOCATE_TEXTS = 500
+
+# The functions being timed.
+FIND = 'find_concordances'
+FIND_ALL = 'find_all_concordances'
+PRINT = 'print_concordances'
+
+def zipf_corpus(size, vocabulary, exponent, seed = 0):
+	"""	Generate a corpus of pseudo-words with Zipf-distributed frequencies.
+
+	@param size - number of words in the corpus
+	@param vocabulary - number of distinct words
+	@param exponent - exponent of the distribution
+	@param seed - seed of the random number generator
+	@return list of words in the corpus, and list of distinct words by
+		rank (most frequent first)"""
+
+	from random import Random
+	random = Random('%d/%d/%s/%d' % (size, vocabulary, exponent, seed))
+
+	# Shorter words are more frequent, as in natural languages.
+	types = set()
+	while len(types) < vocabulary:
+		length = 2 + int(len(types) ** 0.25)
+		types.add(EMPTY.join([random.choice(ALPHABET) \
+			for i in range(0, length)]))
+	types = sorted(types, key = len)
+
+	weights = [1.0 / (rank ** exponent) for rank in range(1, vocabulary + 1)]
+	return random.choices(types, weights = weights, k = size), types
+
+def pick_keywords(types, count):
+	"""	Pick keywords evenly across the ranks of the distinct words.
+
+	@param types - list of distinct words by rank
+	@param count - number of keywords
+	@return list of keywords"""
+
+	count = min(count, len(types))
+	return [types[i * len(types) // count] for i in range(0, count)]
+
+def run_case(case):
+	"""	Time one function on one corpus, in the current process.
+
+	@param case - tuple of the corpus size, vocabulary size, exponent, name
+		of the function, keyword count and context size
+	@return tokens per second, and the growth of the peak resident set size
+		in bytes while the function runs"""
+
+	from time import perf_counter
+	import os
+	import resource
+	import sys
+
+	size, vocabulary, exponent, function, count, context_size = case
+	words, types = zipf_corpus(size, vocabulary, exponent)
+	keywords = pick_keywords(types, count)
+
+	if function == FIND:
+		operation = lambda: concordancer.find_concordances(keywords, words, \
+			context_size)
+	elif function == FIND_ALL:
+		operation = lambda: concordancer.find_all_concordances(words, \
+			context_size)
+	else:
+		concordances = concordancer.find_concordances(keywords, words, \
+			context_size)
+		operation = lambda: concordancer.print_concordances(concordances, \
+			words, True, '*', '*')
+
+	# The peak is given in kilobytes, except on Mac OS, where it is in bytes.
+	def peak_rss():
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return peak if sys.platform == 'darwin' else peak * 1024
+
+	# Only what the function adds to the corpus is counted.
+	baseline = peak_rss()
+
+	# Printed concordances are discarded.
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, 'w')
+	try:
+		rounds = 0
+		start = perf_counter()
+		elapsed = 0
+		while elapsed < MIN_TIME:
+			operation()
+			rounds += 1
+			elapsed = perf_counter() - start
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+	return rounds * size / elapsed, peak_rss() - baseline
+
+def run(size, vocabulary, exponent, counts, contexts, report):
+	"""	Run the whole benchmark, each case in a new process.
+
+	@param size - number of words in the corpus
+	@param vocabulary - number of distinct words
+	@param exponent - exponent of the Zipf distribution
+	@param counts - list of keyword counts
+	@param contexts - list of context sizes
+	@param report - function that displays progress messages
+	@return map of results keyed by a description of each case"""
+
+	from multiprocessing import Pool
+
+	cases = []
+	for context_size in contexts:
+		cases.append((FIND_ALL, 0, context_size))
+		for count in counts:
+			cases.append((FIND, count, context_size))
+			cases.append((PRINT, count, context_size))
+
+	corpus = 'n=%d/v=%d/s=%s' % (size, vocabulary, exponent)
+	report('%s\n' % corpus)
+
+	results = {}
+	pool = Pool(1, maxtasksperchild = 1)
+	try:
+		for function, count, context_size in cases:
+			rate, peak = pool.apply(run_case, [(size, vocabulary, exponent, \
+				function, count, context_size)])
+			case = '%s/%s/k=%d/c=%d' % (function, corpus, count, context_size)
+			results[case] = {'tokens_per_second': rate, \
+				'peak_rss_growth_bytes': peak}
+			report('    %-22s k=%-5d c=%-3d %12.1f tokens/s %12d B\n' \
+				% (function, count, context_size, rate, peak))
+	finally:
+		pool.close()
+		pool.join()
+
+	return results
+
+def collocates_reference(keyword, words, context_size):
+	"""	Count the words around a single-word keyword, one position at a 
+	time, and score them.
+
+	@param keyword - keyword
+	@param words - list of words
+	@param context_size - number of words on each side of the keyword
+	@return map of lowercase words to (count, PMI, t-score, log-likelihood)
+		tuples"""
+
+	import math
+
+	lowered = [word.lower() for word in words]
+	total = len(words)
+
+	# A position is within the windows if it is near any of the hits.
+	window = [i for i in range(0, total) if any([lowered[j] == \
+		keyword.lower() and 0 < abs(i - j) <= context_size \
+		for j in range(0, total)])]
+
+	scores = {}
+	for term in set([lowered[i] for i in window]):
+		observed = len([i for i in window if lowered[i] == term])
+		frequency = lowered.count(term)
+		expected = float(frequency) * len(window) / total
+		g2 = 0.0
+		for count, row, column in [ \
+				(observed, len(window), frequency), \
+				(len(window) - observed, len(window), total - frequency), \
+				(frequency - observed, total - len(window), frequency), \
+				(total - len(window) - frequency + observed, \
+					total - len(window), total - frequency)]:
+			if count > 0:
+				g2 += 2 * count * math.log(count * total / float(row * column))
+		scores[term] = (observed, math.log(observed / expected, 2), \
+			(observed - expected) / math.sqrt(observed), g2)
+	return scores
+
+def check_collocates():
+	"""	Compare find_collocates with collocates_reference on a text with
+	adjacent keywords and on small random texts.
+
+	@return list of failures, as (words, keyword, context size, expected,
+		actual) tuples"""
+
+	from random import Random
+	random = Random('collocates')
+
+	texts = [('z z y a z b a b z b'.split(), 2)]
+	for i in range(0, COLLOCATE_TEXTS):
+		texts.append(([random.choice('abcZ') for j in \
+			range(0, random.randint(1, 12))], random.randint(0, 3)))
+
+	failures = []
+	for words, context_size in texts:
+		keywords = sorted(set([word.lower() for word in words]))
+		try:
+			found = concordancer.find_collocates([], words, context_size)
+		except (ValueError, ZeroDivisionError) as error:
+			failures.append((words, None, context_size, None, str(error)))
+			continue
+		for keyword in keywords:
+			expected = collocates_reference(keyword, words, context_size)
+			actual = dict([(row[0], row[1:]) for row in found[keyword]])
+			if sorted(expected) != sorted(actual) or any([ \
+					abs(x - y) > 1e-9 for term in expected \
+					for x, y in zip(expected[term], actual[term])]):
+				failures.append((words, keyword, context_size, expected, \
+					actual))
+	return failures
+
+def compare(results, baseline, tolerance):
+	"""	List the cases which got slower than in the baseline by more than
+	the tolerance.
+
+	@param results - map of results of the current run
+	@param baseline - map of results of the baseline run
+	@param tolerance - fraction by which a case may be slower
+	@return list of (case, baseline rate, current rate) triples"""
+
+	regressions = []
+	for case in sorted(results):
+		if case not in baseline:
+			continue
+		old = baseline[case]['tokens_per_second']
+		new = results[case]['tokens_per_second']
+		if new < old * (1 - tolerance):
+			regressions.append((case, old, new))
+	return regressions
+
+if __name__ == '__main__':
+	from optparse import OptionParser
+	from os.path import basename
+	from sys import argv, stdout, stderr
+	import json
+
+	parser = OptionParser(usage = '\n%s [OPTIONS]' % basename(argv[0]), \
+		description = 'Benchmarks finding and printing concordances ' + \
+		'with concordancer.py on synthetic Zipf-distributed corpora.')
+	parser.add_option('-w', '--words', dest = 'size', type = 'int', \
+		default = 100000, help = 'Number of words in the corpus.')
+	parser.add_option('-v', '--vocabulary', dest = 'vocabulary', \
+		type = 'int', default = 10000, \
+		help = 'Number of distinct words in the corpus.')
+	parser.add_option('-z', '--exponent', dest = 'exponent', type = 'float', \
+		default = 1.0, help = 'Exponent of the Zipf distribution.')
+	parser.add_option('-k', '--keywords', dest = 'counts', \
+		default = '1,10,100', help = 'Comma-separated keyword counts.')
+	parser.add_option('-c', '--contexts', dest = 'contexts', \
+		default = '2,5,10', help = 'Comma-separated context sizes.')
+	parser.add_option('-o', '--output', dest = 'output', \
+		help = 'Save the results as a JSON baseline.')
+	parser.add_option('-b', '--baseline', dest = 'baseline', \
+		help = 'Compare the results with a JSON baseline.')
+	parser.add_option('-t', '--tolerance', dest = 'tolerance', \
+		type = 'float', default = 0.2, help = 'Report cases slower ' + \
+		'than the baseline by more than this fraction.')
+	opts, args = parser.parse_args()
+
+	counts = [int(n) for n in opts.counts.split(',')]
+	contexts = [int(n) for n in opts.contexts.split(',')]
+
+	status = 0
+
+	for words, keyword, context_size, expected, actual in check_collocates():
+		stderr.write('find_collocates disagrees with the oracle on "%s" ' \
+			'(keyword %s, context %d): expected %s, got %s\n' \
+			% (' '.join(words), keyword, context_size, expected, actual))
+		status = 1
+
+	results = run(opts.size, opts.vocabulary, opts.exponent, counts, \
+		contexts, stdout.write)
+
+	if opts.baseline:
+		with open(opts.baseline) as source:
+			baseline = json.load(source)['results']
+		for case, old, new in compare(results, baseline, opts.tolerance):
+			stderr.write('%s: %.1f tokens/s, baseline %.1f tokens/s\n' \
+				% (case, new, old))
+			status = 1
+
+	if opts.output:
+		with open(opts.output, 'w') as output:
+			json.dump({'results': results}, output, indent = 1, \
+				sort_keys = True)
+
+	exit(status)
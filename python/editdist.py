@@ -167,79 +167,85 @@ def damerau_levenshtein_distance(string_a, string_b, parameters={}):
     return d[len_a][len_b]
 
 
-def jaro_distance(string_a, string_b, parameters={}):
-    """    Establish the Jaro-Winkler edit distance between strings.
-    
-    The Jaro distance is useful for duplicate detection and it is aimed at short
-    strings. It returns a score between 0 and 1 where a higher score signifies 
-    more similar strings.
-
-    The Jaro distance function requires no additional parameters.
+def __jaro_matches(string_a, string_b, matched_a, matched_b):
+    """    Count the matching characters and the transpositions between two
+    strings, as defined by the Jaro distance.
+
+    Characters match if they are the same and no further apart than half the
+    length of the longer string, less one. Only that window is scanned for
+    each character of the first string, and each character of the second
+    string can be matched at most once.
+
+    The flag buffers must be bytearrays at least as long as the respective
+    strings; their prefixes are cleared before use, so they can be reused
+    between calls.
     """
 
-    # The algotihm consists of two basic parts: matching and transpositions: 
-    # each of these is extracted into a sub-function.
-    def __matching_chars(string_a, string_b):
-        """    Align characters of one string against those of the other 
-        string. """
-
-        length_a, length_b = len(string_a), len(string_b)
-
-        max_dist = max(length_a, length_b) / 2 - 1
-
-        matching_a = [ False for i in range(0, length_a) ]
-        matching_b = [ False for i in range(0, length_b) ]
+    length_a, length_b = len(string_a), len(string_b)
+
+    window = max(length_a, length_b) // 2 - 1
+    if window < 0:
+        window = 0
+
+    matched_a[:length_a] = bytes(length_a)
+    matched_b[:length_b] = bytes(length_b)
+
+    # Match each character against the first unmatched alike character within
+    # the window.
+    m = 0
+    for i in range(0, length_a):
+        char = string_a[i]
+        for j in range(max(0, i - window), min(i + window + 1, length_b)):
+            if not matched_b[j] and string_b[j] == char:
+                matched_a[i] = 1
+                matched_b[j] = 1
+                m += 1
+                break
+
+    if m == 0:
+        return 0, 0
+
+    # Matched characters which are out of order in the two strings count as
+    # half-transpositions.
+    half_transpositions = 0
+    j = 0
+    for i in range(0, length_a):
+        if matched_a[i]:
+            while not matched_b[j]:
+                j += 1
+            if string_a[i] != string_b[j]:
+                half_transpositions += 1
+            j += 1
 
-        for i in range(0, length_a):
-            for j in range(0, length_b):
-                if string_a[i] == string_b[j]:
-                    if i - j  == 0 or abs(i - j) < max_dist:
-                        matching_a[i] = True
-                        matching_b[j] = True
+    return m, half_transpositions / 2.0
 
-        return matching_a, matching_b
 
-    def __transpositions(string_a, string_b, matching_a, matching_b):
-        """    Extract subsequences of alike characters and count those that 
-        cannot be alined as requiring transpositions. """
+def __jaro_score(length_a, length_b, m, t):
+    """    Combine the match and transposition counts into the Jaro distance."""
 
-        def __make_sequence(string, matching):
-            """    Extract a subsequence where both strings match. """
+    if m == 0:
+        return 0.0
 
-            sequence = []
-            for i in range(0, len(string)):
-                if matching[i]:
-                    sequence.append(string[i])
-            return sequence
+    m = float(m)
+    return (m / length_a + m / length_b + (m - t) / m) / 3.0
 
-        # Find subsequences.
-        sequence_a = __make_sequence(string_a, matching_a)            
-        sequence_b = __make_sequence(string_b, matching_b)
-        
-        half_transpositions = 0
 
-        # Count half-transpositions.
-        for i in range(0, min(len(sequence_a), len(sequence_b))):
-            #print(len(sequence_a), len(sequence_b), i)
-            if sequence_a[i] != sequence_b[i]:
-                half_transpositions += 1
-        half_transpositions += abs(len(sequence_a) - len(sequence_b))
-
-        return half_transpositions / 2
+def jaro_distance(string_a, string_b, parameters={}):
+    """    Establish the Jaro-Winkler edit distance between strings.
     
-    matching_a, matching_b = __matching_chars(string_a, string_b)
+    The Jaro distance is useful for duplicate detection and it is aimed at short
+    strings. It returns a score between 0 and 1 where a higher score signifies 
+    more similar strings.
 
-    m = float(matching_a.count(True))
-    t = float(__transpositions(string_a, string_b, matching_a, matching_b))
+    The Jaro distance function requires no additional parameters.
+    """
 
-    len_a = float(len(string_a))
-    len_b = float(len(string_b))
+    matched_a = bytearray(len(string_a))
+    matched_b = bytearray(len(string_b))
 
-    module_a = m / len_a if len_a > 0 else 0
-    module_b = m / len_b if len_b > 0 else 0
-    module_t = (m - t) / m if m > 0 else 0
+    m, t = __jaro_matches(string_a, string_b, matched_a, matched_b)
 
-    return (module_a + module_b + module_t) / 3.0
+    return __jaro_score(len(string_a), len(string_b), m, t)
 
 
 def jaro_winkler_distance(string_a, string_b, parameters={}):
@@ -263,18 +269,57 @@ def jaro_winkler_distance(string_a, string_b, parameters={}):
 
     # Establish the ordinary Jaro distance.
     dj = jaro_distance(string_a, string_b, parameters)
-    l = 0
 
     # Account for the prefix - words starting similarly are considered more 
     # similar.    
+    l = __common_prefix(string_a, string_b, max_prefix)
+
+    # Adjust the distance with the prefix-related score.
+    return dj + (p * l * (1 - dj))
+
+
+def __common_prefix(string_a, string_b, max_prefix):
+    """    Establish the length of the common prefix of two strings, up to the
+    given maximum."""
+
+    l = 0
     for i in range(0, min(len(string_a), len(string_b), max_prefix)):
         if string_a[i] == string_b[i]:
             l += 1
         else:
             break
+    return l
 
-    # Adjust the distance with the prefix-related score.
-    return dj + (p * l * (1 - dj))
+
+def jaro_winkler_batch(query, candidates, parameters={}):
+    """    Establish the Jaro-Winkler edit distance between a query and each of
+    a sequence of candidate strings.
+
+    Returns a list of scores in the order of the candidates. The result is the
+    same as calling jaro_winkler_distance for each pair, but the match flag
+    buffers are allocated once for the whole batch. Takes the same parameters
+    as jaro_winkler_distance.
+    """
+
+    p = parameters['p'] if 'p' in parameters else 0.1
+    max_prefix = parameters['max_prefix'] if 'max_prefix' in parameters else 4
+
+    length_q = len(query)
+    matched_q = bytearray(length_q)
+    matched_c = bytearray(64)
+
+    scores = []
+    for candidate in candidates:
+        length_c = len(candidate)
+        if length_c > len(matched_c):
+            matched_c = bytearray(max(length_c, 2 * len(matched_c)))
+
+        m, t = __jaro_matches(query, candidate, matched_q, matched_c)
+        dj = __jaro_score(length_q, length_c, m, t)
+        l = __common_prefix(query, candidate, max_prefix)
+        scores.append(dj + (p * l * (1 - dj)))
+
+    return scores
 
 
 def wagner_fischer_distance (string_a, string_b, parameters={}):
@@ -327,6 +372,247 @@ def wagner_fischer_distance (string_a, string_b, parameters={}):
 
     return d[length_a - 1][length_b - 1]
 
+
+def __wagner_fischer_last_row(string_a, string_b, substitution_cost):
+    """    Compute the last row of the Wagner-Fischer array for two strings,
+    keeping only two rows in memory."""
+
+    previous = list(range(0, len(string_b) + 1))
+    for i in range(1, len(string_a) + 1):
+        char = string_a[i - 1]
+        row = [i]
+        append = row.append
+        left = i
+        # Walk the previous row in pairs of adjacent cells, alongside the
+        # elements of string_b, avoiding indexing in the inner loop.
+        for diagonal, up, other in zip(previous, previous[1:], string_b):
+            best = diagonal if char == other else diagonal + substitution_cost
+            if up + 1 < best:
+                best = up + 1
+            if left + 1 < best:
+                best = left + 1
+            append(best)
+            left = best
+        previous = row
+    return previous
+
+
+def alignment(string_a, string_b, parameters={}):
+    """    Establish a sequence of edit operations transforming one string into
+    the other one.
+
+    Returns a list of triples (operation, element_a, element_b), where the
+    operation is one of 'match', 'substitute', 'delete' (element_b is None)
+    or 'insert' (element_a is None). Applied in order, the operations turn
+    string_a into string_b at the cost given by wagner_fischer_distance.
+
+    The alignment is found using Hirschberg's algorithm: string_a is split in
+    half, the best place to split string_b is found by running the
+    Wagner-Fischer algorithm forwards over the first half and backwards over
+    the second half keeping only the last rows, and both halves are aligned
+    recursively. Memory use is linear in the length of the strings, and time
+    is proportional to the product of their lengths.
+
+    The optional parameter 'cost' is the cost of the substitution operation
+    (1 by default). (Parameter name: 'cost'.)
+    """
+
+    substitution_cost = 1 if 'cost' not in parameters else parameters['cost']
+
+    operations = []
+
+    def __align(a, b):
+        if len(a) == 0:
+            for element in b:
+                operations.append(('insert', None, element))
+            return
+
+        if len(b) == 0:
+            for element in a:
+                operations.append(('delete', element, None))
+            return
+
+        if len(a) == 1:
+            # Either align the element with a matching element, or substitute
+            # it for the first one, or delete it and insert all of b.
+            element = a[0]
+            if element in b:
+                k = list(b).index(element)
+                operation = 'match'
+            elif substitution_cost < 2:
+                k = 0
+                operation = 'substitute'
+            else:
+                operations.append(('delete', element, None))
+                __align(a[0:0], b)
+                return
+            __align(a[0:0], b[:k])
+            operations.append((operation, element, b[k]))
+            __align(a[0:0], b[k + 1:])
+            return
+
+        middle = len(a) // 2
+        forward = __wagner_fischer_last_row(a[:middle], b, substitution_cost)
+        backward = __wagner_fischer_last_row(a[middle:][::-1], b[::-1], \
+                                                            substitution_cost)
+
+        length_b = len(b)
+        split, best = 0, None
+        for k in range(0, length_b + 1):
+            total = forward[k] + backward[length_b - k]
+            if best is None or total < best:
+                split, best = k, total
+
+        __align(a[:middle], b[:split])
+        __align(a[middle:], b[split:])
+
+    __align(string_a, string_b)
+    return operations
+
+
+class CostModel:
+    """    Per-character costs of edit operations.
+
+    The model consists of maps of substitution costs keyed by pairs of
+    characters (the character from the first string, then the one from the
+    second), and of insertion and deletion costs keyed by characters. Anything
+    not in the maps costs the default. Substituting a character for itself is
+    always free.
+
+    Before use the model is compiled into dense tables: every character that
+    appears in the maps gets a code, all other characters share code 0, and
+    the costs are kept in lists indexed by those codes. The compiled tables
+    are cached until the model is changed with set_substitution,
+    set_insertion or set_deletion.
+    """
+
+    # Rows of a QWERTY keyboard, for the keyboard adjacency model.
+    QWERTY = ['1234567890', 'qwertyuiop', 'asdfghjkl', 'zxcvbnm']
+
+    def __init__(self, substitution={}, insertion={}, deletion={}, \
+                default_substitution=1, default_insertion=1, default_deletion=1):
+        """    Create a model from maps of costs and default costs."""
+        self.substitution = dict(substitution)
+        self.insertion = dict(insertion)
+        self.deletion = dict(deletion)
+        self.default_substitution = default_substitution
+        self.default_insertion = default_insertion
+        self.default_deletion = default_deletion
+        self.tables = None
+
+    def set_substitution(self, char_a, char_b, cost, symmetric=True):
+        """    Set the cost of substituting char_b for char_a (and the other way
+        round, if symmetric)."""
+        self.substitution[(char_a, char_b)] = cost
+        if symmetric:
+            self.substitution[(char_b, char_a)] = cost
+        self.tables = None
+
+    def set_insertion(self, char, cost):
+        """    Set the cost of inserting a character."""
+        self.insertion[char] = cost
+        self.tables = None
+
+    def set_deletion(self, char, cost):
+        """    Set the cost of deleting a character."""
+        self.deletion[char] = cost
+        self.tables = None
+
+    def compile(self):
+        """    Build the lookup tables, or return the cached ones. Returns the
+        map from characters to codes, the substitution table (a list of rows
+        indexed by codes), and the insertion and deletion tables."""
+        if self.tables is not None:
+            return self.tables
+
+        alphabet = set(self.insertion) | set(self.deletion)
+        for char_a, char_b in self.substitution:
+            alphabet.add(char_a)
+            alphabet.add(char_b)
+
+        codes = {}
+        for char in sorted(alphabet):
+            codes[char] = len(codes) + 1
+        size = len(codes) + 1
+
+        substitution = [[self.default_substitution] * size \
+                                                for i in range(0, size)]
+        for i in range(1, size):
+            substitution[i][i] = 0
+        for (char_a, char_b), cost in self.substitution.items():
+            substitution[codes[char_a]][codes[char_b]] = cost
+
+        insertion = [self.default_insertion] * size
+        for char, cost in self.insertion.items():
+            insertion[codes[char]] = cost
+
+        deletion = [self.default_deletion] * size
+        for char, cost in self.deletion.items():
+            deletion[codes[char]] = cost
+
+        self.tables = (codes, substitution, insertion, deletion)
+        return self.tables
+
+    @staticmethod
+    def keyboard(cost=0.5, layout=QWERTY):
+        """    Create a model where substituting a key for one next to it on the
+        keyboard (in the same row, or in an adjacent row at a similar
+        position) costs less than other substitutions."""
+        model = CostModel()
+        for r in range(0, len(layout)):
+            for c in range(0, len(layout[r])):
+                neighbours = [(r, c + 1), (r + 1, c - 1), (r + 1, c)]
+                for nr, nc in neighbours:
+                    if nr < len(layout) and 0 <= nc < len(layout[nr]):
+                        model.set_substitution(layout[r][c], layout[nr][nc], \
+                                                                        cost)
+        return model
+
+
+def weighted_distance(string_a, string_b, parameters={}):
+    """    Establish the weighted edit distance between strings.
+
+    This is the Wagner-Fischer algorithm where the cost of each insertion,
+    deletion and substitution depends on the characters involved, as given
+    by a CostModel (Parameter name: 'model'). The model is compiled into
+    lookup tables once, and both strings are translated into codes before the
+    main loop, so each cell of the array costs a few list lookups, like the
+    unweighted version. Without a model all operations cost 1 and the result
+    is the Levenshtein distance.
+    """
+
+    model = parameters['model'] if 'model' in parameters else CostModel()
+    codes, substitution, insertion, deletion = model.compile()
+
+    codes_a = [codes.get(char, 0) for char in string_a]
+    codes_b = [codes.get(char, 0) for char in string_b]
+    insertions_b = [insertion[code] for code in codes_b]
+
+    # The first row: inserting consecutive characters of string_b.
+    previous = [0]
+    for cost in insertions_b:
+        previous.append(previous[-1] + cost)
+
+    for char, code in zip(string_a, codes_a):
+        substitution_row = substitution[code]
+        removal_cost = deletion[code]
+        left = previous[0] + removal_cost
+        row = [left]
+        append = row.append
+        for diagonal, up, other, other_code, insertion_cost in \
+                zip(previous, previous[1:], string_b, codes_b, insertions_b):
+            best = diagonal if char == other \
+                            else diagonal + substitution_row[other_code]
+            if up + removal_cost < best:
+                best = up + removal_cost
+            if left + insertion_cost < best:
+                best = left + insertion_cost
+            append(best)
+            left = best
+        previous = row
+
+    return previous[-1]
+
 # All the functions and their names for convenience.
 API = {
     'Levenshtein': levenshtein_distance, 
@@ -334,16 +620,1083 @@ API = {
     'Hamming': hamming_distance,
     'Jaro': jaro_distance,
     'Jaro-Winkler': jaro_winkler_distance,
-    'Wagner-Fischer': wagner_fischer_distance, 
+    'Wagner-Fischer': wagner_fischer_distance,
+    'Weighted': weighted_distance,
 }
 
+# The functions whose result does not depend on the order of the strings.
+# Damerau-Levenshtein is not among them, since it does not count the cost of
+# insertions.
+SYMMETRIC = set([
+    'Levenshtein',
+    'Hamming',
+    'Jaro',
+    'Jaro-Winkler',
+    'Wagner-Fischer',
+])
+
+class DistanceCache:
+    """    A bounded least-recently-used cache of distances.
+
+    Results are keyed by the pair of strings, the name of the method from API
+    and its parameters. The pair is put in a fixed order for the methods in
+    SYMMETRIC, so that looking up (b, a) hits the result computed for (a, b).
+    Lists of tokens are keyed as tuples.
+
+    The cache is opt-in: use its distance method directly, wrap a single
+    function with wrap, or get a cached counterpart of the whole API with
+    api. The contents can be saved to a file and loaded in a later run.
+    """
+
+    def __init__(self, maxsize=100000):
+        """    Create an empty cache holding at most maxsize results."""
+        from collections import OrderedDict
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, method, string_a, string_b, parameters):
+        """    Create the cache key for a distance computation."""
+        if not isinstance(string_a, (str, tuple)):
+            string_a = tuple(string_a)
+        if not isinstance(string_b, (str, tuple)):
+            string_b = tuple(string_b)
+        if method in SYMMETRIC:
+            try:
+                if string_b < string_a:
+                    string_a, string_b = string_b, string_a
+            except TypeError:
+                pass
+        return (string_a, string_b, method, tuple(sorted(parameters.items())))
+
+    def distance(self, method, string_a, string_b, parameters={}):
+        """    Establish the distance between strings using the method with the
+        given name from API, or retrieve it if it was computed before."""
+        key = self.key(method, string_a, string_b, parameters)
+        entries = self.entries
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+
+        self.misses += 1
+        result = API[method](string_a, string_b, parameters)
+        entries[key] = result
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return result
+
+    def wrap(self, method):
+        """    Create a cached version of the function with the given name from
+        API, with the same signature."""
+        def cached(string_a, string_b, parameters={}):
+            return self.distance(method, string_a, string_b, parameters)
+        cached.__name__ = API[method].__name__
+        cached.__doc__ = API[method].__doc__
+        return cached
+
+    def api(self):
+        """    Create a counterpart of API where every function is cached."""
+        return dict([(method, self.wrap(method)) for method in API])
+
+    def hit_rate(self):
+        """    The fraction of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        """    Summarize the use of the cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
+
+    def clear(self):
+        """    Remove all results and reset the statistics."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path):
+        """    Write the cached results to a file, least recently used first."""
+        from pickle import dump, HIGHEST_PROTOCOL
+        with open(path, 'wb') as output:
+            dump(list(self.entries.items()), output, HIGHEST_PROTOCOL)
+
+    def load(self, path):
+        """    Add the results from a file written by save to the cache. Entries
+        that do not fit are evicted as usual."""
+        from pickle import load
+        with open(path, 'rb') as source:
+            for key, result in load(source):
+                self.entries[key] = result
+                self.entries.move_to_end(key)
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class BKTree:
+    """    A Burkhard-Keller tree over a dictionary of words.
+
+    The tree indexes words using a metric (one of the distance functions from
+    API that satisfies the triangle inequality: Levenshtein or
+    Wagner-Fischer). Each node keeps its children in a map keyed by their
+    distance to the node, so a search for words within a given radius only
+    has to descend into children whose key is within that radius of the
+    distance between the query and the node. Jaro and Jaro-Winkler are
+    similarity scores rather than metrics, Damerau-Levenshtein is not
+    symmetric, and Hamming is undefined (-1) for words of different lengths,
+    so they cannot be used here.
+
+    The number of distance evaluations performed by the most recent query is
+    kept in 'evaluations'.
+    """
+
+    # The methods from API which are metrics.
+    METRICS = set([
+        'Levenshtein',
+        'Wagner-Fischer',
+    ])
+
+    def __init__(self, method='Levenshtein', words=[], parameters={}):
+        """    Create a tree using the metric with the given name from API and
+        bulk-insert the given words."""
+        if method not in BKTree.METRICS:
+            raise ValueError('Method %s is not a metric supported by the ' \
+                                                    'BK-tree' % method)
+        self.method = method
+        self.parameters = parameters
+        self.root = None
+        self.size = 0
+        self.evaluations = 0
+        self.build(words)
+
+    def distance(self, string_a, string_b):
+        """    Apply the tree's metric to a pair of strings."""
+        self.evaluations += 1
+        return API[self.method](string_a, string_b, self.parameters)
+
+    def build(self, words):
+        """    Insert all the given words into the tree."""
+        for word in words:
+            self.insert(word)
+
+    def insert(self, word):
+        """    Insert a word into the tree. Words already in the tree are
+        ignored. Returns True if the word was added."""
+        if self.root is None:
+            self.root = (word, {})
+            self.size += 1
+            return True
+
+        node = self.root
+        while True:
+            node_word, children = node
+            d = self.distance(word, node_word)
+            if d == 0:
+                return False
+            if d not in children:
+                children[d] = (word, {})
+                self.size += 1
+                return True
+            node = children[d]
+
+    def search(self, query, radius):
+        """    Find all words within the given distance of the query. Returns a
+        list of (distance, word) pairs sorted by distance."""
+        self.evaluations = 0
+        results = []
+        if self.root is None:
+            return results
+
+        stack = [self.root]
+        while stack:
+            word, children = stack.pop()
+            d = self.distance(query, word)
+            if d <= radius:
+                results.append((d, word))
+            # By the triangle inequality only children whose distance to this
+            # node is within [d - radius, d + radius] can contain matches.
+            for key in children:
+                if d - radius <= key <= d + radius:
+                    stack.append(children[key])
+
+        results.sort()
+        return results
+
+    def nearest(self, query, k=1):
+        """    Find the k words closest to the query. Returns a list of
+        (distance, word) pairs sorted by distance."""
+        from heapq import heappush, heappushpop
+
+        self.evaluations = 0
+        if self.root is None or k < 1:
+            return []
+
+        # The heap holds the k best candidates so far, with negated distances
+        # so that the worst candidate sits on top; its distance is the current
+        # search radius.
+        best = []
+        radius = float('inf')
+        stack = [self.root]
+        while stack:
+            word, children = stack.pop()
+            d = self.distance(query, word)
+            if len(best) < k:
+                heappush(best, (-d, word))
+            elif d < radius:
+                heappushpop(best, (-d, word))
+            if len(best) == k:
+                radius = -best[0][0]
+            for key in children:
+                if d - radius <= key <= d + radius:
+                    stack.append(children[key])
+
+        return sorted([(-d, word) for d, word in best])
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, word):
+        return self.search(word, 0) != []
+
+    def save(self, path):
+        """    Write the tree to a file."""
+        from pickle import dump, HIGHEST_PROTOCOL
+        with open(path, 'wb') as output:
+            state = (self.method, self.parameters, self.size, self.root)
+            dump(state, output, HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """    Read a tree previously written with save."""
+        from pickle import load
+        with open(path, 'rb') as source:
+            method, parameters, size, root = load(source)
+        tree = BKTree(method, [], parameters)
+        tree.size = size
+        tree.root = root
+        return tree
+
+def qgrams(string, q=2):
+    """    List the q-grams of a string (or a list of tokens).
+
+    The string is padded with q - 1 sentinels on both sides, so that a string
+    of length n has exactly n + q - 1 q-grams and the characters at its ends
+    are covered as often as the ones in the middle. The n-th repetition of the
+    same q-gram is returned as the pair (q-gram, n), which turns the multiset
+    of q-grams into a set.
+    """
+    if isinstance(string, str):
+        padded = '\0' * (q - 1) + string + '\0' * (q - 1)
+    else:
+        padded = (None,) * (q - 1) + tuple(string) + (None,) * (q - 1)
+
+    seen = {}
+    grams = []
+    for i in range(0, len(padded) - q + 1):
+        gram = padded[i:i + q]
+        n = seen.get(gram, 0)
+        seen[gram] = n + 1
+        grams.append((gram, n))
+    return grams
+
+class QGramIndex:
+    """    An inverted index from q-grams to the words that contain them.
+
+    The index finds candidates for an approximate search by filtering, and
+    only verifies the candidates with the exact distance function:
+
+        * length filtering: a word whose length differs from the query by
+          more than k cannot be within k edit operations of it,
+        * count filtering (the q-gram lemma): a single edit operation destroys
+          at most q of the q-grams of a word, so a word within k operations
+          of the query shares at least max(n, m) + q - 1 - k * q q-grams
+          with it.
+
+    The filters hold for Levenshtein, Wagner-Fischer and Hamming. They do not
+    hold for Damerau-Levenshtein, which does not count the cost of
+    insertions. When the substitution cost (parameter name: 'cost') is below 1,
+    the distance threshold admits proportionally more operations.
+
+    Filter selectivity is accumulated in 'stats'.
+    """
+
+    # How many q-grams a single edit operation can destroy, as a multiple of
+    # q plus a constant.
+    DESTROYED = {
+        'Levenshtein': 0,
+        'Wagner-Fischer': 0,
+        'Hamming': 0,
+    }
+
+    def __init__(self, words=[], q=2, method='Levenshtein', parameters={}):
+        """    Create an index of q-grams of the given length verifying
+        candidates with the method with the given name from API."""
+        if method not in QGramIndex.DESTROYED:
+            raise ValueError('Method %s is not supported by the q-gram index' \
+                                                                    % method)
+        self.q = q
+        self.method = method
+        self.parameters = parameters
+        self.words = []
+        self.postings = {}
+        self.lengths = {}
+        self.reset_stats()
+        self.build(words)
+
+    def reset_stats(self):
+        """    Clear the filter selectivity statistics."""
+        self.stats = {
+            'queries': 0,
+            'entries': 0,
+            'length_candidates': 0,
+            'count_candidates': 0,
+            'results': 0,
+        }
+
+    def selectivity(self):
+        """    Return the fraction of the indexed entries that passed the length
+        filter and then the count filter, on average over all queries."""
+        total = float(self.stats['entries'])
+        if total == 0:
+            return 0.0, 0.0
+        return self.stats['length_candidates'] / total, \
+               self.stats['count_candidates'] / total
+
+    def build(self, words):
+        """    Add all the given words to the index."""
+        for word in words:
+            self.insert(word)
+
+    def insert(self, word):
+        """    Add a word to the index and return its ID."""
+        identifier = len(self.words)
+        self.words.append(word)
+        for gram in qgrams(word, self.q):
+            self.postings.setdefault(gram, []).append(identifier)
+        self.lengths.setdefault(len(word), []).append(identifier)
+        return identifier
+
+    def operations(self, max_distance):
+        """    The largest number of edit operations that fit within the given
+        distance."""
+        cost = self.parameters['cost'] if 'cost' in self.parameters else 1
+        cheapest = min(1, cost)
+        if cheapest <= 0:
+            return float('inf')
+        return int(max_distance / cheapest)
+
+    def candidates(self, query, max_distance):
+        """    Find the IDs of the words that pass both filters."""
+        k = self.operations(max_distance)
+        length = len(query)
+        self.stats['queries'] += 1
+        self.stats['entries'] += len(self.words)
+
+        # Length filter.
+        admissible = set()
+        for n in self.lengths:
+            if abs(n - length) <= k:
+                admissible.update(self.lengths[n])
+        self.stats['length_candidates'] += len(admissible)
+
+        # Count filter. Without a positive bound on the number of shared
+        # q-grams it is useless, so everything that passed the length filter
+        # remains a candidate.
+        destroyed = self.q + QGramIndex.DESTROYED[self.method]
+        if k * destroyed >= length + self.q - 1:
+            candidates = sorted(admissible)
+            self.stats['count_candidates'] += len(candidates)
+            return candidates
+
+        shared = {}
+        for gram in qgrams(query, self.q):
+            for identifier in self.postings.get(gram, ()):
+                if identifier in admissible:
+                    shared[identifier] = shared.get(identifier, 0) + 1
+
+        candidates = []
+        for identifier in sorted(shared):
+            n = max(length, len(self.words[identifier]))
+            if shared[identifier] >= n + self.q - 1 - k * destroyed:
+                candidates.append(identifier)
+        self.stats['count_candidates'] += len(candidates)
+        return candidates
+
+    def search(self, query, max_distance):
+        """    Find all words within the given distance of the query. Returns a
+        list of (distance, word) pairs sorted by distance."""
+        distance = API[self.method]
+        results = []
+        for identifier in self.candidates(query, max_distance):
+            word = self.words[identifier]
+            d = distance(query, word, self.parameters)
+            if 0 <= d <= max_distance:
+                results.append((d, word))
+        self.stats['results'] += len(results)
+        results.sort()
+        return results
+
+    def __len__(self):
+        return len(self.words)
+
+class Trie:
+    """    A prefix tree of words for finding all words within a given distance
+    of a query.
+
+    The search walks the tree computing one row of the Wagner-Fischer array
+    per node: the row for a node is derived from the row of its parent, so it
+    is shared by every word that starts with the node's prefix. Whenever the
+    smallest value in a row exceeds the maximum distance, no word below the
+    node can be close enough and the whole subtree is skipped.
+
+    The optional parameter 'cost' is the cost of the substitution operation
+    (1 by default), as in wagner_fischer_distance. The number of rows computed
+    by the most recent search is kept in 'evaluations'.
+    """
+
+    def __init__(self, words=[]):
+        """    Create a tree containing the given words."""
+        # Each node is a pair: a map of children keyed by characters, and the
+        # word that ends at the node (or None).
+        self.root = [{}, None]
+        self.size = 0
+        self.evaluations = 0
+        self.build(words)
+
+    def build(self, words):
+        """    Insert all the given words into the tree."""
+        for word in words:
+            self.insert(word)
+
+    def insert(self, word):
+        """    Insert a word into the tree. Returns True if the word was
+        added."""
+        node = self.root
+        for char in word:
+            children = node[0]
+            if char not in children:
+                children[char] = [{}, None]
+            node = children[char]
+        if node[1] is not None:
+            return False
+        node[1] = word
+        self.size += 1
+        return True
+
+    def search(self, query, max_distance, parameters={}):
+        """    Find all words within the given distance of the query. Returns a
+        list of (distance, word) pairs sorted by distance."""
+        removal_cost = 1
+        insertion_cost = 1
+        substitution_cost = 1 if 'cost' not in parameters \
+                                                    else parameters['cost']
+
+        length = len(query) + 1
+        results = []
+        self.evaluations = 0
+
+        first_row = [j * insertion_cost for j in range(0, length)]
+        if self.root[1] is not None and first_row[-1] <= max_distance:
+            results.append((first_row[-1], self.root[1]))
+
+        stack = [(child, char, first_row) \
+                            for char, child in self.root[0].items()]
+        while stack:
+            node, char, previous = stack.pop()
+            self.evaluations += 1
+
+            row = [previous[0] + removal_cost]
+            for j in range(1, length):
+                m1 = previous[j - 1] + \
+                            (0 if query[j - 1] == char else substitution_cost)
+                m2 = previous[j] + removal_cost
+                m3 = row[j - 1] + insertion_cost
+                row.append(min(m1, m2, m3))
+
+            if node[1] is not None and row[-1] <= max_distance:
+                results.append((row[-1], node[1]))
+
+            # Values in a column never decrease going down the tree, so if
+            # the whole row is too far, so is everything below.
+            if min(row) <= max_distance:
+                for char, child in node[0].items():
+                    stack.append((child, char, row))
+
+        results.sort()
+        return results
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, word):
+        node = self.root
+        for char in word:
+            if char not in node[0]:
+                return False
+            node = node[0][char]
+        return node[1] is not None
+
+class IncrementalMatcher:
+    """    A query typed one character at a time, matched against a fixed list
+    of candidates.
+
+    For each candidate the matcher keeps a stack of rows of the Wagner-Fischer
+    array, one per character of the query. Appending a character to the query
+    computes one more row from the previous one, and removing the last
+    character pops a row, so each keystroke costs time proportional to the
+    total length of the candidates instead of recomputing every distance
+    from scratch.
+
+    The optional parameter 'cost' is the cost of the substitution operation
+    (1 by default). (Parameter name: 'cost'.)
+    """
+
+    def __init__(self, candidates, parameters={}):
+        """    Create a matcher with an empty query."""
+        self.candidates = list(candidates)
+        self.parameters = parameters
+        self.query = []
+        self.rows = [[list(range(0, len(candidate) + 1))] \
+                                            for candidate in self.candidates]
+
+    def append(self, char):
+        """    Add a character at the end of the query."""
+        substitution_cost = 1 if 'cost' not in self.parameters \
+                                            else self.parameters['cost']
+        self.query.append(char)
+        i = len(self.query)
+
+        for candidate, stack in zip(self.candidates, self.rows):
+            previous = stack[-1]
+            left = i
+            row = [left]
+            append = row.append
+            for diagonal, up, other in zip(previous, previous[1:], candidate):
+                best = diagonal if char == other \
+                                            else diagonal + substitution_cost
+                if up + 1 < best:
+                    best = up + 1
+                if left + 1 < best:
+                    best = left + 1
+                append(best)
+                left = best
+            stack.append(row)
+
+    def extend(self, string):
+        """    Add several characters at the end of the query."""
+        for char in string:
+            self.append(char)
+
+    def pop(self):
+        """    Remove the last character of the query and return it."""
+        char = self.query.pop()
+        for stack in self.rows:
+            stack.pop()
+        return char
+
+    def set(self, string):
+        """    Change the query, reusing the rows of the common prefix of the old
+        and the new query."""
+        common = 0
+        while common < min(len(self.query), len(string)) \
+                                    and self.query[common] == string[common]:
+            common += 1
+        while len(self.query) > common:
+            self.pop()
+        self.extend(string[common:])
+
+    def distances(self):
+        """    List the distances between the query and each candidate, in the
+        order of the candidates."""
+        return [stack[-1][-1] for stack in self.rows]
+
+    def matches(self, max_distance, prefix=False):
+        """    Find the candidates within the given distance of the query.
+        Returns a list of (distance, candidate) pairs sorted by distance.
+
+        If prefix is set, the distance of a candidate is the distance between
+        the query and the closest prefix of the candidate, so that candidates
+        which start with something similar to the query match, as expected
+        while the query is being typed."""
+        results = []
+        for candidate, stack in zip(self.candidates, self.rows):
+            d = min(stack[-1]) if prefix else stack[-1][-1]
+            if d <= max_distance:
+                results.append((d, candidate))
+        results.sort()
+        return results
+
+    def __str__(self):
+        return ''.join(self.query)
+
+
+class TokenEncoder:
+    """    An interning table mapping tokens to integer IDs.
+
+    Sentences encoded with the same encoder are arrays of unsigned integers,
+    so comparing two tokens in the inner loop of a distance function is an
+    integer comparison rather than a string comparison, and a corpus of
+    sentences takes much less memory than lists of strings. Use one encoder
+    per corpus, so that equal tokens always get the same ID.
+    """
+
+    def __init__(self):
+        """    Create an empty encoder."""
+        self.ids = {}
+        self.tokens = []
+
+    def encode(self, sentence):
+        """    Convert a sentence (a string split at whitespace, or a list of
+        tokens) to an array of token IDs, interning new tokens."""
+        from array import array
+
+        if isinstance(sentence, str):
+            sentence = sentence.split()
+
+        ids = self.ids
+        tokens = self.tokens
+        encoded = array('I')
+        for token in sentence:
+            identifier = ids.get(token)
+            if identifier is None:
+                identifier = ids[token] = len(tokens)
+                tokens.append(token)
+            encoded.append(identifier)
+        return encoded
+
+    def decode(self, encoded):
+        """    Convert an array of token IDs back to a list of tokens."""
+        tokens = self.tokens
+        return [tokens[identifier] for identifier in encoded]
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def token_distance(sentence_a, sentence_b, method='Levenshtein', \
+                                            parameters={}, encoder=None):
+    """    Establish the edit distance between two sentences, treating whole
+    tokens as the elements of the sequences.
+
+    The sentences may be strings (split at whitespace), lists of tokens, or
+    arrays of token IDs produced by the given encoder. Strings and lists are
+    encoded first, with a new encoder if none is given. Levenshtein and
+    Wagner-Fischer distances are computed keeping just two rows of integers;
+    the other methods from API are applied to the ID arrays directly. Takes
+    the same parameters as the chosen method.
+    """
+    from array import array
+
+    if encoder is None:
+        encoder = TokenEncoder()
+    if not isinstance(sentence_a, array):
+        sentence_a = encoder.encode(sentence_a)
+    if not isinstance(sentence_b, array):
+        sentence_b = encoder.encode(sentence_b)
+
+    if method in ('Levenshtein', 'Wagner-Fischer'):
+        cost = parameters['cost'] if 'cost' in parameters else 1
+        return __wagner_fischer_last_row(sentence_a.tolist(), \
+                                            sentence_b.tolist(), cost)[-1]
+
+    return API[method](sentence_a, sentence_b, parameters)
+
+
+def bounded_distance(string_a, string_b, max_distance, parameters={}):
+    """    Establish the Levenshtein edit distance between strings if it does not
+    exceed a threshold.
+
+    The Wagner-Fischer array is filled row by row, and since the smallest
+    value in a row never decreases from one row to the next, the computation
+    stops as soon as it exceeds max_distance. In that case None is returned.
+
+    The optional parameter 'cost' is the cost of the substitution operation
+    (1 by default). (Parameter name: 'cost'.)
+    """
+
+    substitution_cost = 1 if 'cost' not in parameters else parameters['cost']
+
+    if abs(len(string_a) - len(string_b)) > max_distance:
+        return None
+
+    previous = list(range(0, len(string_b) + 1))
+    for i in range(1, len(string_a) + 1):
+        char = string_a[i - 1]
+        left = i
+        row = [left]
+        append = row.append
+        smallest = left
+        for diagonal, up, other in zip(previous, previous[1:], string_b):
+            best = diagonal if char == other else diagonal + substitution_cost
+            if up + 1 < best:
+                best = up + 1
+            if left + 1 < best:
+                best = left + 1
+            append(best)
+            left = best
+            if best < smallest:
+                smallest = best
+        if smallest > max_distance:
+            return None
+        previous = row
+
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+def nearest(query, candidates, k=1, method='Levenshtein', parameters={}, \
+                                                                    q=2):
+    """    Find the k candidates closest to the query.
+
+    Returns a list of up to k (distance, candidate) pairs, closest first, with
+    ties going to the candidate that comes first. For Jaro and Jaro-Winkler,
+    which are similarity scores, the candidates with the highest scores are
+    returned, and Hamming ignores candidates of a different length.
+
+    For Levenshtein and Wagner-Fischer the candidates are checked against the
+    distance of the current k-th best match using cheap lower bounds first:
+    the difference in length, half the L1 distance between the character
+    histograms, and the number of q-grams that are not shared, divided by q
+    (each operation changes at most q of them). Candidates that pass are
+    compared using bounded_distance with the k-th best distance as the
+    threshold. A substitution cost (parameter name: 'cost') below 1 lowers
+    the bounds accordingly.
+    """
+    from heapq import heappush, heappushpop
+
+    if k < 1:
+        return []
+
+    # Similarities: keep the k highest scores.
+    if method in ('Jaro', 'Jaro-Winkler'):
+        best = []
+        function = API[method]
+        for i, candidate in enumerate(candidates):
+            entry = (function(query, candidate, parameters), -i, candidate)
+            if len(best) < k:
+                heappush(best, entry)
+            elif entry > best[0]:
+                heappushpop(best, entry)
+        best.sort(reverse=True)
+        return [(score, candidate) for score, i, candidate in best]
+
+    # The heap keeps the k best matches with negated distances, so that the
+    # worst of them is on top.
+    best = []
+    infinity = float('inf')
+
+    if method not in ('Levenshtein', 'Wagner-Fischer'):
+        function = API[method]
+        for i, candidate in enumerate(candidates):
+            d = function(query, candidate, parameters)
+            if d < 0:
+                continue
+            entry = (-d, -i, candidate)
+            if len(best) < k:
+                heappush(best, entry)
+            elif entry > best[0]:
+                heappushpop(best, entry)
+        best.sort(reverse=True)
+        return [(-d, candidate) for d, i, candidate in best]
+
+    from collections import Counter
+
+    cost = parameters['cost'] if 'cost' in parameters else 1
+    histogram_weight = min(1.0, cost / 2.0)
+    operation_weight = min(1.0, cost)
+
+    length_q = len(query)
+    histogram_q = Counter(query)
+    grams_q = set(qgrams(query, q))
+
+    for i, candidate in enumerate(candidates):
+        threshold = -best[0][0] if len(best) == k else infinity
+
+        # Bounds, from the cheapest to the most expensive.
+        if abs(len(candidate) - length_q) >= threshold:
+            continue
+
+        if threshold != infinity:
+            histogram_c = Counter(candidate)
+            difference = 0
+            for char, count in histogram_q.items():
+                difference += abs(count - histogram_c.get(char, 0))
+            for char, count in histogram_c.items():
+                if char not in histogram_q:
+                    difference += count
+            if difference * histogram_weight >= threshold:
+                continue
+
+            grams_c = qgrams(candidate, q)
+            unshared = max(len(grams_q), len(grams_c)) - \
+                                            len(grams_q.intersection(grams_c))
+            if float(unshared) / q * operation_weight >= threshold:
+                continue
+
+        # Ties are resolved in favour of earlier candidates, so only strictly
+        # better candidates can replace the k-th best.
+        if threshold == infinity:
+            d = bounded_distance(query, candidate, infinity, parameters)
+        else:
+            d = bounded_distance(query, candidate, threshold, parameters)
+            if d is None or d >= threshold:
+                continue
+
+        entry = (-d, -i, candidate)
+        if len(best) < k:
+            heappush(best, entry)
+        else:
+            heappushpop(best, entry)
+
+    best.sort(reverse=True)
+    return [(-d, candidate) for d, i, candidate in best]
+
+
+def cluster(strings, threshold, method='Levenshtein', parameters={}, \
+            blocking=('neighbourhood', 'prefix', 'qgram'), window=5, \
+            prefix_length=3, q=3, max_block=100):
+    """    Group similar strings into clusters.
+
+    Comparing all pairs of strings is out of the question for long lists, so
+    only the pairs that share a block are compared. The blocking strategies
+    are:
+
+        * 'neighbourhood': the strings are sorted, and each is compared to
+          the next window - 1 strings in that order,
+        * 'prefix': strings sharing the first prefix_length characters
+          (ignoring case) are compared,
+        * 'qgram': strings sharing a q-gram (ignoring case) are compared.
+
+    Prefix and q-gram blocks larger than max_block are skipped, since they
+    consist of pairs that share a very common key; raising max_block or
+    window, or lowering q and prefix_length, trades speed for recall.
+
+    A pair of strings is linked if its distance is at most the threshold
+    (for Jaro and Jaro-Winkler: if the score is at least the threshold), and
+    clusters are the connected components of the links. Yields pairs of
+    (index, cluster) in the order of the input, where the cluster is the
+    index of its first string.
+    """
+
+    strings = list(strings)
+    parent = list(range(0, len(strings)))
+
+    def __find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def __union(i, j):
+        i, j = __find(i), __find(j)
+        if i < j:
+            parent[j] = i
+        elif j < i:
+            parent[i] = j
+
+    if method in ('Levenshtein', 'Wagner-Fischer'):
+        def __similar(a, b):
+            return bounded_distance(a, b, threshold, parameters) is not None
+    elif method in ('Jaro', 'Jaro-Winkler'):
+        def __similar(a, b):
+            return API[method](a, b, parameters) >= threshold
+    else:
+        def __similar(a, b):
+            return 0 <= API[method](a, b, parameters) <= threshold
+
+    compared = set()
+
+    def __compare(i, j):
+        if i > j:
+            i, j = j, i
+        if (i, j) in compared or __find(i) == __find(j):
+            return
+        compared.add((i, j))
+        if __similar(strings[i], strings[j]):
+            __union(i, j)
+
+    def __compare_blocks(blocks):
+        for members in blocks.values():
+            if len(members) > max_block:
+                continue
+            for a in range(0, len(members)):
+                for b in range(a + 1, len(members)):
+                    __compare(members[a], members[b])
+
+    if 'neighbourhood' in blocking:
+        order = sorted(range(0, len(strings)), key=strings.__getitem__)
+        for a in range(0, len(order)):
+            for b in range(a + 1, min(a + window, len(order))):
+                __compare(order[a], order[b])
+
+    if 'prefix' in blocking:
+        blocks = {}
+        for i, string in enumerate(strings):
+            blocks.setdefault(string[:prefix_length].lower(), []).append(i)
+        __compare_blocks(blocks)
+
+    if 'qgram' in blocking:
+        blocks = {}
+        for i, string in enumerate(strings):
+            lowered = string.lower()
+            grams = set([lowered[g:g + q] \
+                                for g in range(0, len(lowered) - q + 1)])
+            for gram in grams:
+                blocks.setdefault(gram, []).append(i)
+        __compare_blocks(blocks)
+
+    for i in range(0, len(strings)):
+        yield i, __find(i)
+
+
+def __compare_batch(task):
+    """    Compare the tab-separated pairs in a block of input lines and format
+    the results."""
+    from json import dumps
+
+    block, methods, parameters, format = task
+    functions = [API[method] for method in methods]
+
+    # Only new lines end records (and the carriage returns before them are
+    # dropped), so that every input line gives exactly one output line.
+    lines = block.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+
+    output = []
+    for line in lines:
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        line = line.decode('utf-8', 'replace')
+        string_a, _, string_b = line.partition('\t')
+        results = [function(string_a, string_b, parameters) \
+                                                for function in functions]
+        if format == 'jsonl':
+            record = {'a': string_a, 'b': string_b}
+            record.update(zip(methods, results))
+            output.append(dumps(record, ensure_ascii=False))
+        else:
+            output.append('\t'.join([string_a, string_b] + \
+                                            [str(result) for result in results]))
+    output.append('')
+    return '\n'.join(output).encode('utf-8')
+
+
+def pipe(source, output, methods, parameters={}, format='tsv', jobs=1, \
+                                                        block_size=1 << 20):
+    """    Establish distances between pairs of strings read from a stream.
+
+    Each line of the binary source stream contains a pair of strings separated
+    by a tab (a line without a tab pairs the line with an empty string). The
+    input is read in blocks of about block_size bytes, cut at line ends, and
+    the blocks are processed by a pool of jobs worker processes. For each pair
+    the results of the methods with the given names from API are written to
+    the binary output stream in input order, either as tab-separated values
+    following the pair ('tsv') or as JSON objects, one per line ('jsonl').
+    Lines end with a new line character, optionally preceded by a carriage
+    return.
+    """
+
+    if format not in ('tsv', 'jsonl'):
+        raise ValueError('Unknown format: %s' % format)
+
+    def __blocks():
+        while True:
+            block = source.read(block_size)
+            if not block:
+                return
+            if not block.endswith(b'\n'):
+                block += source.readline()
+            yield (block, methods, parameters, format)
+
+    if jobs == 1:
+        for task in __blocks():
+            output.write(__compare_batch(task))
+        return
+
+    from multiprocessing import Pool
+    pool = Pool(jobs)
+    try:
+        # Keep enough blocks in flight to occupy every worker.
+        for result in pool.imap(__compare_batch, __blocks(), 1):
+            output.write(result)
+    finally:
+        pool.terminate()
+
+
 # A demonstration.
 if __name__ == '__main__':
-    from sys import argv, stdout
+    from sys import argv, stdout, stdin, stderr
+    from getopt import getopt, GetoptError
+
+    usage = "Usage: %s WORD_A WORD_B [ WORD_A WORD_B [...] ]\n" \
+            "       %s --pipe [--method=NAME ...] [--parameter=NAME=VALUE ...]\n" \
+            "              [--format=tsv|jsonl] [--jobs=N] < PAIRS\n" \
+            "       %s --cluster=THRESHOLD [--method=NAME]\n" \
+            "              [--parameter=NAME=VALUE ...] < STRINGS\n" \
+                                                % (argv[0], argv[0], argv[0])
+
+    try:
+        options, argv[1:] = getopt(argv[1:], '', \
+            ['pipe', 'method=', 'parameter=', 'format=', 'jobs=', 'cluster='])
+    except GetoptError as error:
+        stderr.write("%s\n" % error)
+        stdout.write(usage)
+        exit(-1)
+
+    from multiprocessing import cpu_count
+
+    methods, parameters, format, jobs = [], {}, 'tsv', cpu_count()
+    threshold = None
+    for option, value in options:
+        if option == '--method':
+            if value not in API:
+                stderr.write("Unknown method: %s\n" % value)
+                exit(-1)
+            methods.append(value)
+        elif option == '--parameter':
+            name, _, number = value.partition('=')
+            try:
+                parameters[name] = int(number)
+            except ValueError:
+                try:
+                    parameters[name] = float(number)
+                except ValueError:
+                    stderr.write("Invalid parameter value: %s\n" % value)
+                    exit(-1)
+        elif option == '--format':
+            if value not in ('tsv', 'jsonl'):
+                stderr.write("Unknown format: %s\n" % value)
+                exit(-1)
+            format = value
+        elif option == '--jobs':
+            jobs = int(value)
+        elif option == '--cluster':
+            threshold = float(value)
+
+    # The pipeline mode: read pairs from standard input.
+    if ('--pipe', '') in options:
+        pipe(stdin.buffer, stdout.buffer, methods or ['Levenshtein'], \
+                                                    parameters, format, jobs)
+        exit(0)
+
+    # The clustering mode: read strings from standard input.
+    if threshold is not None:
+        strings = [line.rstrip('\n') for line in stdin]
+        method = methods[0] if methods else 'Levenshtein'
+        for i, group in cluster(strings, threshold, method, parameters):
+            stdout.write('%d\t%s\n' % (group, strings[i]))
+        exit(0)
 
     if len(argv) < 3 or len(argv) % 2 < 1:
-        stdout.write("Usage: %s WORD_A WORD_B [ WORD_A WORD_B [...] ]\n" \
-                                                                    % argv[0])
+        stdout.write(usage)
         exit(-1)
     
     for i in range(1, int(len(argv)/2) + 1):
@@ -0,0 +1,397 @@
+#!/usr/bin/python3
+#
+# Edit distance benchmark
+#
+# Measures the speed and memory use of the functions in editdist.py and
+# checks the faster implementations against the reference dynamic
+# programming ones, and the search structures against a linear scan.
+#
+# Pairs of strings are generated for every combination of string length,
+# alphabet size and similarity level (the fraction of positions of the first
+# string that are kept in the second one; the rest are mutated by random
+# substitutions, insertions and deletions). Every function in editdist.API is
+# timed on each set of pairs, and its peak memory use is recorded. Every
+# implementation that has a reference oracle is checked for agreement with
+# it on every pair, and disagreements are reported as failures. The Jaro
+# functions are checked against a plain implementation of the definition
+# written here. BKTree, QGramIndex, nearest and cluster are checked against
+# a linear scan over a small list of words made from the pairs.
+#
+# The results can be saved as a JSON baseline, and later runs can be compared
+# against it to spot performance regressions.
+#
+# Usage:
+#     editdist_benchmark.py [OPTIONS]
+#
+# Options:
+#   -l LENGTHS, --lengths=LENGTHS
+#                         Comma-separated string lengths (default: 8,32,128).
+#   -a ALPHABETS, --alphabets=ALPHABETS
+#                         Comma-separated alphabet sizes (default: 2,4,26).
+#   -s LEVELS, --similarity=LEVELS
+#                         Comma-separated similarity levels between 0 and 1
+#                         (default: 0.0,0.5,0.9).
+#   -n PAIRS, --pairs=PAIRS
+#                         Number of pairs per combination (default: 50).
+#   -o FILE, --output=FILE
+#                         Save the results as a JSON baseline.
+#   -b FILE, --baseline=FILE
+#                         Compare the results with a JSON baseline.
+#   -t TOLERANCE, --tolerance=TOLERANCE
+#                         Report functions slower than the baseline by more
+#                         than this fraction (default: 0.2).
+#
+# Requires:
+#     Python 3
+#
+# Author:
+#     Konrad Siek <konrad.siek@gmail.com>
+#
+# License information:
+#     Copyright 2011 Konrad Siek
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import editdist
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+
+# The minimum time spent timing each function on a set of pairs (seconds).
+MIN_TIME = 0.2
+
+# The number of words and queries used to check the search structures, and
+# their maximum length (the linear scan is slow for long strings).
+SEARCH_WORDS = 20
+SEARCH_QUERIES = 5
+SEARCH_LENGTH = 16
+
+def mutate(string, similarity, alphabet, random):
+    """    Create a copy of a string where roughly the given fraction of the
+    positions is left unchanged."""
+    result = []
+    for char in string:
+        if random.random() < similarity:
+            result.append(char)
+            continue
+        operation = random.randint(0, 2)
+        if operation == 0:
+            result.append(random.choice(alphabet))
+        elif operation == 1:
+            result.append(char)
+            result.append(random.choice(alphabet))
+    return ''.join(result)
+
+def generate_pairs(length, alphabet_size, similarity, count, seed=0):
+    """    Generate pairs of strings of a given length over an alphabet of a
+    given size, with a given level of similarity."""
+    from random import Random
+    random = Random('%d/%d/%s/%d' % (length, alphabet_size, similarity, seed))
+    alphabet = ALPHABET[:alphabet_size]
+    pairs = []
+    for i in range(0, count):
+        string = ''.join([random.choice(alphabet) for j in range(0, length)])
+        pairs.append((string, mutate(string, similarity, alphabet, random)))
+    return pairs
+
+def jaro_reference(a, b):
+    """    The Jaro score, straight from the definition: characters match if
+    they are equal and at most max(n, m) / 2 - 1 positions apart, each
+    character matching at most once, and half of the matched characters
+    that are out of order are transpositions."""
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    used_a, used_b = [False] * len(a), [False] * len(b)
+    for i in range(0, len(a)):
+        for j in range(0, len(b)):
+            if abs(i - j) <= window and not used_b[j] and a[i] == b[j]:
+                used_a[i] = used_b[j] = True
+                break
+    matches_a = [a[i] for i in range(0, len(a)) if used_a[i]]
+    matches_b = [b[j] for j in range(0, len(b)) if used_b[j]]
+    m = len(matches_a)
+    if m == 0:
+        return 0.0
+    t = sum([1 for x, y in zip(matches_a, matches_b) if x != y]) / 2.0
+    return (float(m) / len(a) + float(m) / len(b) + (m - t) / m) / 3.0
+
+def jaro_winkler_reference(a, b):
+    """    The Jaro-Winkler score with the default parameters: a common
+    prefix of up to 4 characters, each raising the score by a tenth of what
+    it lacks to 1."""
+    score = jaro_reference(a, b)
+    prefix = 0
+    while prefix < min(4, len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    return score + 0.1 * prefix * (1 - score)
+
+def oracles():
+    """    List the implementations which must agree with a reference
+    implementation, as (name, implementation, reference) triples of
+    functions of a pair of strings."""
+    infinity = float('inf')
+    unit = editdist.CostModel()
+    encoder = editdist.TokenEncoder()
+
+    def trie_distance(a, b):
+        return editdist.Trie([b]).search(a, infinity)[0][0]
+
+    def alignment_cost(a, b):
+        return sum([0 if operation == 'match' else 1 \
+                for operation, x, y in editdist.alignment(a, b)])
+
+    return [
+        ('Wagner-Fischer', editdist.wagner_fischer_distance, \
+                                            editdist.levenshtein_distance),
+        ('Weighted', lambda a, b: editdist.weighted_distance(a, b, \
+                            {'model': unit}), editdist.levenshtein_distance),
+        ('bounded_distance', lambda a, b: editdist.bounded_distance(a, b, \
+                                    infinity), editdist.levenshtein_distance),
+        ('token_distance', lambda a, b: editdist.token_distance(list(a), \
+            list(b), 'Levenshtein', {}, encoder), editdist.levenshtein_distance),
+        ('Trie', trie_distance, editdist.levenshtein_distance),
+        ('alignment', alignment_cost, editdist.levenshtein_distance),
+        ('Jaro', editdist.jaro_distance, jaro_reference),
+        ('Jaro-Winkler', editdist.jaro_winkler_distance, \
+                                                    jaro_winkler_reference),
+        ('jaro_winkler_batch', lambda a, b: \
+                editdist.jaro_winkler_batch(a, [b])[0], jaro_winkler_reference),
+    ]
+
+def search_oracles(words, method, parameters, radius, k):
+    """    List the search structures which must agree with a linear scan
+    over the words, as (name, implementation, reference) triples of
+    functions of a query. The distances are computed with the reference
+    implementation of the method from editdist.API."""
+    distance = editdist.API[method]
+
+    def scan(query):
+        return [(distance(query, word, parameters), word) for word in words]
+
+    def within(query):
+        return sorted([(d, word) for d, word in scan(query) \
+                                                    if 0 <= d <= radius])
+
+    def closest(query):
+        found = [(d, i, word) for i, (d, word) in enumerate(scan(query)) \
+                                                                    if d >= 0]
+        return [(d, word) for d, i, word in sorted(found)[:k]]
+
+    def components(query):
+        # Links between all pairs, with the query as one more word.
+        strings = words + [query]
+        labels = list(range(0, len(strings)))
+        for i in range(0, len(strings)):
+            for j in range(i + 1, len(strings)):
+                d = distance(strings[i], strings[j], parameters)
+                if 0 <= d <= radius and labels[i] != labels[j]:
+                    old, new = max(labels[i], labels[j]), \
+                                                min(labels[i], labels[j])
+                    labels = [new if label == old else label \
+                                                        for label in labels]
+        return list(enumerate(labels))
+
+    index = editdist.QGramIndex(words, 2, method, parameters)
+    checked = [
+        ('QGramIndex.search', lambda query: index.search(query, radius), \
+                                                                    within),
+        ('nearest', lambda query: editdist.nearest(query, words, k, \
+                                            method, parameters), closest),
+        # Comparing every pair avoids the misses allowed by blocking.
+        ('cluster', lambda query: list(editdist.cluster(words + [query], \
+            radius, method, parameters, ('neighbourhood',), \
+                                    len(words) + 2)), components),
+    ]
+    if method in editdist.BKTree.METRICS:
+        tree = editdist.BKTree(method, words, parameters)
+        checked += [
+            ('BKTree.search', lambda query: tree.search(query, radius), \
+                                                                    within),
+            # Ties may be broken either way, so only the distances are
+            # compared.
+            ('BKTree.nearest', lambda query: [d for d, word \
+                in tree.nearest(query, k)], lambda query: [d for d, word \
+                                                        in closest(query)]),
+        ]
+    return [('%s/%s' % (name, method), implementation, reference) \
+                                for name, implementation, reference in checked]
+
+def measure(function, pairs):
+    """    Time a function of a pair of strings over a list of pairs and measure
+    its peak memory use. Returns pairs per second and peak bytes."""
+    from time import perf_counter
+    import tracemalloc
+
+    # Memory is measured in a separate pass, since tracing slows things down.
+    tracemalloc.start()
+    for a, b in pairs:
+        function(a, b)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    rounds = 0
+    start = perf_counter()
+    elapsed = 0
+    while elapsed < MIN_TIME:
+        for a, b in pairs:
+            function(a, b)
+        rounds += 1
+        elapsed = perf_counter() - start
+
+    return rounds * len(pairs) / elapsed, peak
+
+def check(name, implementation, reference, pairs):
+    """    Compare an implementation with its reference on all pairs. Returns
+    the list of pairs on which they disagree."""
+    failures = []
+    for a, b in pairs:
+        expected, actual = reference(a, b), implementation(a, b)
+        if abs(expected - actual) > 1e-9:
+            failures.append({'a': a, 'b': b, 'expected': expected, \
+                                                            'actual': actual})
+    return failures
+
+def check_searches(pairs):
+    """    Compare the search structures with a linear scan, over words
+    taken from the first strings of the pairs and queries taken from the
+    second ones, so that every query is similar to some of the words. Returns
+    the list of queries on which they disagree."""
+    pairs = [(a[:SEARCH_LENGTH], b[:SEARCH_LENGTH]) for a, b in pairs]
+    words = sorted(set([a for a, b in pairs[:SEARCH_WORDS]]))
+    queries = [b for a, b in pairs[:SEARCH_QUERIES]]
+    radius = max(1, len(words[0]) // 4) if words else 1
+    failures = []
+
+    # Hamming only applies to words of the same length: it is checked on
+    # words of one length, and on words of mixed lengths, which must be
+    # skipped when their lengths differ from the query.
+    hamming_queries = [b[:len(a)] + a[len(b):] \
+                                    for a, b in pairs[:SEARCH_QUERIES]]
+    mixed = sorted(set(words + [b for a, b in pairs[:SEARCH_WORDS]]))
+    cases = [('Levenshtein', {}, words, queries), \
+             ('Wagner-Fischer', {'cost': 0.5}, words, queries), \
+             ('Hamming', {}, words, hamming_queries), \
+             ('Hamming', {}, mixed, hamming_queries + queries)]
+
+    for method, parameters, words, queries in cases:
+        for name, implementation, reference in search_oracles(words, method, \
+                                                    parameters, radius, 3):
+            for query in queries:
+                expected, actual = reference(query), implementation(query)
+                if expected != actual:
+                    failures.append({'implementation': name, 'a': query, \
+                        'b': 'radius %s' % radius, 'expected': expected, \
+                                                            'actual': actual})
+    return failures
+
+def run(lengths, alphabets, levels, count, report):
+    """    Run the whole benchmark. Returns a map of results keyed by a
+    description of each case, and the list of oracle failures."""
+    results = {}
+    failures = []
+    functions = [(method, editdist.API[method]) for method in editdist.API]
+    checked = oracles()
+
+    for length in lengths:
+        for alphabet_size in alphabets:
+            for similarity in levels:
+                pairs = generate_pairs(length, alphabet_size, similarity, \
+                                                                        count)
+                case = 'n=%d/k=%d/s=%s' % (length, alphabet_size, similarity)
+                report('%s\n' % case)
+
+                # Implementations from API are only timed once.
+                for name, function in functions + [(name, f) \
+                        for name, f, r in checked if name not in editdist.API]:
+                    rate, peak = measure(function, pairs)
+                    results['%s/%s' % (name, case)] = \
+                                    {'ops_per_second': rate, 'peak_bytes': peak}
+                    report('    %-20s %12.1f pairs/s %10d B\n' \
+                                                        % (name, rate, peak))
+
+                for name, implementation, reference in checked:
+                    for failure in check(name, implementation, reference, \
+                                                                        pairs):
+                        failure['implementation'] = name
+                        failures.append(failure)
+                failures.extend(check_searches(pairs))
+
+    return results, failures
+
+def compare(results, baseline, tolerance):
+    """    List the cases which got slower than in the baseline by more than
+    the tolerance, as (case, baseline rate, current rate) triples."""
+    regressions = []
+    for case in sorted(results):
+        if case not in baseline:
+            continue
+        old = baseline[case]['ops_per_second']
+        new = results[case]['ops_per_second']
+        if new < old * (1 - tolerance):
+            regressions.append((case, old, new))
+    return regressions
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    from os.path import basename
+    from sys import argv, stdout, stderr
+    import json
+
+    parser = OptionParser(usage='\n%s [OPTIONS]' % basename(argv[0]), \
+        description='Benchmarks the functions in editdist.py and checks ' + \
+        'the fast implementations against the reference ones.')
+    parser.add_option('-l', '--lengths', dest='lengths', default='8,32,128', \
+        help='Comma-separated string lengths.')
+    parser.add_option('-a', '--alphabets', dest='alphabets', default='2,4,26', \
+        help='Comma-separated alphabet sizes.')
+    parser.add_option('-s', '--similarity', dest='levels', \
+        default='0.0,0.5,0.9', \
+        help='Comma-separated similarity levels between 0 and 1.')
+    parser.add_option('-n', '--pairs', dest='count', type='int', default=50, \
+        help='Number of pairs per combination.')
+    parser.add_option('-o', '--output', dest='output', \
+        help='Save the results as a JSON baseline.')
+    parser.add_option('-b', '--baseline', dest='baseline', \
+        help='Compare the results with a JSON baseline.')
+    parser.add_option('-t', '--tolerance', dest='tolerance', type='float', \
+        default=0.2, help='Report functions slower than the baseline by ' + \
+        'more than this fraction.')
+    opts, args = parser.parse_args()
+
+    lengths = [int(n) for n in opts.lengths.split(',')]
+    alphabets = [int(n) for n in opts.alphabets.split(',')]
+    levels = [float(n) for n in opts.levels.split(',')]
+
+    results, failures = run(lengths, alphabets, levels, opts.count, \
+                                                                stdout.write)
+
+    for failure in failures:
+        stderr.write('%(implementation)s disagrees with the oracle on ' \
+            '"%(a)s", "%(b)s": expected %(expected)s, got %(actual)s\n' \
+                                                                    % failure)
+
+    status = 1 if failures else 0
+
+    if opts.baseline:
+        with open(opts.baseline) as source:
+            baseline = json.load(source)['results']
+        for case, old, new in compare(results, baseline, opts.tolerance):
+            stderr.write('%s: %.1f pairs/s, baseline %.1f pairs/s\n' \
+                                                            % (case, new, old))
+            status = 1
+
+    if opts.output:
+        with open(opts.output, 'w') as output:
+            json.dump({'results': results, 'failures': failures}, output, \
+                                                    indent=1, sort_keys=True)
+
+    exit(status)